@@ -1,377 +1,149 @@
-import json
-import smtplib
 import os
-import time
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime
 import logging
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from webdriver_manager.chrome import ChromeDriverManager
 from dotenv import load_dotenv
 
+from browser_pool import BrowserPool
+from dom_extract import extract_cards, read_state_listings
+from metrics import METRICS
+from monitor_flow import MonitorFlow
+from page_ready import ReadinessTracker
+from resource_blocking import ResourceBlocker
+from tiered_fetch import TieredFetcher
+
 load_dotenv()
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class AirbnbMonitorSelenium:
+class AirbnbMonitorSelenium(MonitorFlow):
+    # Seconds to wait for the listing cards of a page without listing state
+    readiness_deadline = 25
+    
     def __init__(self):
-        # Email configuration
-        self.smtp_server = "smtp.gmail.com"
-        self.smtp_port = 587
-        self.sender_email = os.getenv('SENDER_EMAIL')
-        self.sender_password = os.getenv('SENDER_PASSWORD')
-        self.recipient_email = os.getenv('RECIPIENT_EMAIL')
+        super().__init__()
         
-        # File to store previously seen listings
-        self.data_file = 'seen_listings.json'
+        # Warm Chrome sessions shared by every check, one tab per search, recycled
+        # after BROWSER_MAX_PAGE_LOADS page loads or BROWSER_MAX_RSS_MB of memory
+        # Images, fonts, media and trackers are blocked (see resource_blocking.json)
+        self.blocking = ResourceBlocker.load()
+        self.readiness = ReadinessTracker(deadline=self.readiness_deadline)
+        self.browsers = BrowserPool(self.create_driver,
+                                    size=int(os.getenv('BROWSER_POOL_SIZE', '1')),
+                                    tabs=int(os.getenv('BROWSER_TABS', '4')),
+                                    max_page_loads=int(os.getenv('BROWSER_MAX_PAGE_LOADS', '100')),
+                                    max_rss_mb=int(os.getenv('BROWSER_MAX_RSS_MB', '1500')),
+                                    prepare_tab=self.blocking.prepare_tab,
+                                    throttle=self.limiter.acquire,
+                                    forget=self.blocking.forget)
         
-        # Your Airbnb search URL
-        self.search_url = os.getenv('AIRBNB_SEARCH_URL')
+        # Plain HTTP first; Chrome only for searches whose pages need it (FETCH_TIERS=browser to always use Chrome)
+        tiers = {'http': self.fetch_http, 'browser': self.fetch_browser}
+        self.fetcher = TieredFetcher([(name.strip(), tiers[name.strip()])
+                                      for name in os.getenv('FETCH_TIERS', 'http,browser').split(',')],
+                                     min_listings=int(os.getenv('TIER_MIN_LISTINGS', '3')))
+    
+    def create_driver(self):
+        """Start a Chrome WebDriver with options to avoid detection (used by the browser pool)"""
+        chrome_options = Options()
         
-        # Load previously seen listings
-        self.seen_listings = self.load_seen_listings()
+        # Return from driver.get() at DOMContentLoaded; readiness is judged by the listing cards
+        chrome_options.page_load_strategy = 'eager'
         
-        # WebDriver setup
-        self.driver = None
-    
-    def setup_driver(self):
-        """Set up Chrome WebDriver with options to avoid detection"""
-        try:
-            chrome_options = Options()
-            
-            # Add options to make the browser less detectable
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-            chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            chrome_options.add_experimental_option('useAutomationExtension', False)
-            chrome_options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-            
-            # For testing, we'll run in headless mode (no visible browser)
-            # Comment out the next line if you want to see the browser
-            chrome_options.add_argument("--headless")
-            
-            # Automatically download and setup ChromeDriver
-            service = Service(ChromeDriverManager().install())
-            
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
-            
-            # Execute script to remove automation indicators
-            self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-            
-            logger.info("WebDriver setup successful")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error setting up WebDriver: {e}")
-            return False
-    
-    def load_seen_listings(self):
-        """Load previously seen listings from file"""
-        try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    return set(json.load(f))
-            return set()
-        except Exception as e:
-            logger.error(f"Error loading seen listings: {e}")
-            return set()
-    
-    def save_seen_listings(self):
-        """Save seen listings to file"""
-        try:
-            with open(self.data_file, 'w') as f:
-                json.dump(list(self.seen_listings), f)
-        except Exception as e:
-            logger.error(f"Error saving seen listings: {e}")
-    
-    def get_listings(self):
-        """Fetch current listings using Selenium"""
-        if not self.driver:
-            if not self.setup_driver():
-                return []
+        # Add options to make the browser less detectable
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        chrome_options.add_experimental_option('useAutomationExtension', False)
+        chrome_options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
         
-        try:
-            logger.info("Loading Airbnb search page...")
-            self.driver.get(self.search_url)
-            
-            # Wait a bit for the page to load
-            time.sleep(5)
-            
-            # Wait for listings to load
-            try:
-                WebDriverWait(self.driver, 20).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='card-container']"))
-                )
-            except:
-                logger.warning("Timeout waiting for listings to load")
-            
-            # Try multiple selectors to find listing cards
-            listing_selectors = [
-                "[data-testid='card-container']",
-                "[data-testid='listing-card-title']",
-                "div[itemProp='itemListElement']",
-                "a[href*='/rooms/']",
-                "div[data-testid='card-container'] a"
-            ]
-            
-            current_listings = []
-            
-            for selector in listing_selectors:
-                try:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    logger.info(f"Found {len(elements)} elements with selector: {selector}")
-                    
-                    for element in elements:
-                        try:
-                            # Try to extract listing URL and ID
-                            link_element = element if element.tag_name == 'a' else element.find_element(By.CSS_SELECTOR, "a[href*='/rooms/']")
-                            listing_url = link_element.get_attribute('href')
-                            
-                            if listing_url and '/rooms/' in listing_url:
-                                # Extract listing ID from URL
-                                listing_id = listing_url.split('/rooms/')[-1].split('?')[0].split('/')[0]
-                                
-                                # Try to get listing title
-                                try:
-                                    title_element = element.find_element(By.CSS_SELECTOR, "[data-testid='listing-card-title']")
-                                    title = title_element.text.strip()
-                                except:
-                                    try:
-                                        title_element = element.find_element(By.CSS_SELECTOR, "div[data-testid='listing-card-title']")
-                                        title = title_element.text.strip()
-                                    except:
-                                        title = f"Airbnb Listing {listing_id}"
-                                
-                                # Try to get price
-                                price = None
-                                price_selectors = [
-                                    "[data-testid='price-availability']",
-                                    "span._1y74zjx",
-                                    "span[data-testid='price']",
-                                    "div._1jo4hgw span",
-                                    "span",
-                                    "div[data-testid='price-availability'] span"
-                                ]
-                                
-                                for price_selector in price_selectors:
-                                    try:
-                                        price_elements = element.find_elements(By.CSS_SELECTOR, price_selector)
-                                        for price_element in price_elements:
-                                            price_text = price_element.text.strip()
-                                            if price_text and any(currency in price_text for currency in ['kr', '$', '€', '£', 'DKK']):
-                                                price = price_text
-                                                break
-                                        if price:
-                                            break
-                                    except:
-                                        continue
-                                
-                                # Try to get image
-                                image_url = None
-                                image_selectors = [
-                                    "img[data-testid='listing-card-image']",
-                                    "img[data-original]",
-                                    "img[src*='airbnb']",
-                                    "picture img",
-                                    "img"
-                                ]
-                                
-                                for img_selector in image_selectors:
-                                    try:
-                                        img_element = element.find_element(By.CSS_SELECTOR, img_selector)
-                                        src = img_element.get_attribute('src') or img_element.get_attribute('data-original')
-                                        if src and ('airbnb' in src or 'https://' in src):
-                                            image_url = src
-                                            break
-                                    except:
-                                        continue
-                                
-                                if listing_id and len(listing_id) > 3:  # Valid listing ID
-                                    current_listings.append({
-                                        'id': listing_id,
-                                        'name': title or f"Listing {listing_id}",
-                                        'url': listing_url,
-                                        'price': price,
-                                        'image_url': image_url
-                                    })
-                        
-                        except Exception as e:
-                            continue  # Skip this element if we can't extract data
-                    
-                    if current_listings:
-                        break  # If we found listings with this selector, stop trying others
-                        
-                except Exception as e:
-                    logger.debug(f"Selector {selector} failed: {e}")
-                    continue
-            
-            # Remove duplicates based on ID
-            seen_ids = set()
-            unique_listings = []
-            for listing in current_listings:
-                if listing['id'] not in seen_ids:
-                    seen_ids.add(listing['id'])
-                    unique_listings.append(listing)
-            
-            logger.info(f"Found {len(unique_listings)} unique listings")
-            
-            return unique_listings
-            
-        except Exception as e:
-            logger.error(f"Error fetching listings with Selenium: {e}")
-            return []
-    
-    def send_notification(self, new_listings):
-        """Send email notification for new listings"""
-        if not new_listings:
-            return
+        # Searches load side by side in tabs; keep background tabs running at full speed
+        chrome_options.add_argument("--disable-background-timer-throttling")
+        chrome_options.add_argument("--disable-backgrounding-occluded-windows")
+        chrome_options.add_argument("--disable-renderer-backgrounding")
         
-        try:
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email
-            msg['To'] = self.recipient_email
-            msg['Subject'] = f"🏠 {len(new_listings)} New Airbnb Listing(s) Found!"
-            msg.set_charset('utf-8')
-            
-            # Create email body
-            body = f"""
-            <h2>New Airbnb Listings Found!</h2>
-            <p>Found {len(new_listings)} new listing(s) matching your search criteria:</p>
-            <br>
-            """
-            
-            for listing in new_listings:
-                # Clean the listing name to avoid encoding issues
-                clean_name = listing['name'].encode('ascii', 'ignore').decode('ascii') if listing['name'] else f"Listing {listing['id']}"
-                price_display = listing.get('price', 'Price not available')
-                image_url = listing.get('image_url', '')
-                
-                # Create the listing HTML with image and price
-                listing_html = f"""
-                <div style="border: 1px solid #ddd; padding: 20px; margin: 15px 0; border-radius: 8px; background-color: #fafafa;">
-                    <div style="display: flex; align-items: flex-start; gap: 15px;">
-                """
-                
-                # Add image if available
-                if image_url:
-                    listing_html += f"""
-                        <div style="flex-shrink: 0;">
-                            <img src="{image_url}" alt="Property image" style="width: 120px; height: 90px; object-fit: cover; border-radius: 6px; border: 1px solid #ddd;">
-                        </div>
-                    """
-                
-                listing_html += f"""
-                        <div style="flex-grow: 1;">
-                            <h3 style="margin: 0 0 8px 0; color: #222; font-size: 16px;">{clean_name}</h3>
-                            <p style="margin: 5px 0; color: #666; font-size: 14px;"><strong>Price:</strong> <span style="color: #ff5a5f; font-weight: bold;">{price_display}</span></p>
-                            <p style="margin: 5px 0; color: #666; font-size: 14px;"><strong>ID:</strong> {listing['id']}</p>
-                            <p style="margin: 10px 0 0 0;"><a href="{listing['url']}" style="color: #ff5a5f; text-decoration: none; font-weight: bold; background-color: #fff; padding: 8px 16px; border: 2px solid #ff5a5f; border-radius: 4px; display: inline-block;">📍 View Listing</a></p>
-                        </div>
-                    </div>
-                </div>
-                """
-                
-                body += listing_html
-            
-            body += f"""
-            <br>
-            <p style="color: #666; font-size: 12px;">
-                Alert sent at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            </p>
-            """
-            
-            # Attach with explicit UTF-8 encoding
-            html_part = MIMEText(body.encode('utf-8'), 'html', 'utf-8')
-            msg.attach(html_part)
-            
-            # Send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.sender_email, self.sender_password)
-            
-            # Use send_message for better encoding handling
-            server.send_message(msg)
-            server.quit()
-            
-            logger.info(f"Email notification sent for {len(new_listings)} new listings")
-            
-        except Exception as e:
-            logger.error(f"Error sending email: {e}")
-    
-    def check_for_new_listings(self):
-        """Main function to check for new listings"""
-        logger.info("Checking for new listings...")
+        # Skip downloads the listing cards do not need and log network events for the savings report
+        self.blocking.apply_options(chrome_options)
         
-        current_listings = self.get_listings()
-        if not current_listings:
-            logger.warning("No listings found - this might indicate an issue")
-            return
+        # For testing, we'll run in headless mode (no visible browser)
+        # Comment out the next line if you want to see the browser
+        chrome_options.add_argument("--headless")
         
-        new_listings = []
-        current_ids = set()
+        # Automatically download and setup ChromeDriver
+        service = Service(ChromeDriverManager().install())
         
-        for listing in current_listings:
-            listing_id = listing['id']
-            current_ids.add(listing_id)
-            
-            if listing_id not in self.seen_listings:
-                new_listings.append(listing)
-                logger.info(f"New listing found: {listing['name']} (ID: {listing_id})")
+        driver = webdriver.Chrome(service=service, options=chrome_options)
         
-        # Update seen listings
-        self.seen_listings.update(current_ids)
-        self.save_seen_listings()
+        # Execute script to remove automation indicators
+        driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
         
-        # Send notification if new listings found
-        if new_listings:
-            self.send_notification(new_listings)
-            logger.info(f"Found {len(new_listings)} new listings")
-        else:
-            logger.info("No new listings found")
+        logger.info("WebDriver setup successful")
+        return driver
     
-    def run_once(self):
-        """Run the monitor once"""
-        try:
-            self.check_for_new_listings()
-        except Exception as e:
-            logger.error(f"Error in monitoring: {e}")
-        finally:
-            if self.driver:
-                self.driver.quit()
+    def read_page(self, driver, url):
+        """Collect a loaded search tab's listings, from the page state when it has one"""
+        # Read the page's listing state in one script call and parse it like the HTTP backend does
+        with METRICS.stage('state_read'):
+            listings = read_state_listings(driver)
+        if not listings:
+            logger.warning("No listing state in the page - falling back to the rendered cards")
+            
+            # Wait until the listing cards stop changing instead of sleeping a fixed time
+            with METRICS.stage('readiness'):
+                self.readiness.wait(driver, url)
+            
+            # Collect every card's id, url, title, price and image in one WebDriver round trip
+            with METRICS.stage('card_extract'):
+                listings = extract_cards(driver)
+            if not listings and 'captcha' in driver.page_source.lower():
+                self.limiter.penalize("captcha page in Chrome")
+        self.blocking.report(driver)
+        return listings
     
-    def run_continuous(self, interval_minutes=30):
-        """Run the monitor continuously"""
-        logger.info(f"Starting continuous monitoring (checking every {interval_minutes} minutes)")
-        
-        try:
-            while True:
-                try:
-                    self.check_for_new_listings()
-                    logger.info(f"Sleeping for {interval_minutes} minutes...")
-                    time.sleep(interval_minutes * 60)
-                except KeyboardInterrupt:
-                    logger.info("Monitoring stopped by user")
-                    break
-                except Exception as e:
-                    logger.error(f"Error in monitoring loop: {e}")
-                    time.sleep(300)  # Wait 5 minutes before retrying
-        finally:
-            if self.driver:
-                self.driver.quit()
+    def fetch_browser(self, searches):
+        """Load the searches in the browser pool, one tab per search"""
+        logger.info(f"Loading {len(searches)} Airbnb search page(s) in Chrome...")
+        pages = self.browsers.map(self.read_page, [search['url'] for search in searches])
+        for search, current_listings in zip(searches, pages):
+            if current_listings is None:
+                logger.error(f"Error fetching listings with Selenium for '{search['name']}'")
+        return list(zip(searches, pages))
+    
+    def get_all_listings(self, searches=None):
+        """Fetch the given searches (default: all) with the cheapest tier that works for each"""
+        results = self.fetcher.fetch(searches or self.searches)
+        for search, current_listings in results:
+            logger.info(f"Found {len(current_listings)} unique listings for '{search['name']}'")
+        return results
+    
+    def finish_cycle(self):
+        """Record the browser memory gauge, then finish the cycle like every monitor"""
+        METRICS.gauge('browser_rss_bytes', self.browsers.rss_bytes())
+        super().finish_cycle()
+    
+    def summaries(self):
+        return [self.fetcher.summary(), self.browsers.summary(), self.blocking.summary()] + super().summaries()
+    
+    def after_cycle(self):
+        """Log the cycle and replace recycled browsers now so startup does not delay the next check"""
+        super().after_cycle()
+        # While HTTP serves every search, Chrome is only started by the pool when a search needs it
+        if self.fetcher.uses('browser'):
+            self.browsers.warm()
+    
+    def close(self):
+        """Close the browsers, then everything the base monitor opened"""
+        self.browsers.close()
+        super().close()
 
 def main():
     # Verify required environment variables
-    required_vars = ['SENDER_EMAIL', 'SENDER_PASSWORD', 'RECIPIENT_EMAIL', 'AIRBNB_SEARCH_URL']
+    required_vars = ['SENDER_EMAIL', 'SENDER_PASSWORD', 'RECIPIENT_EMAIL']
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
@@ -380,12 +152,18 @@ def main():
         return
     
     monitor = AirbnbMonitorSelenium()
+    if not monitor.searches:
+        logger.error("No searches configured - set AIRBNB_SEARCH_URL or add enabled searches to searches.json")
+        return
     
     # Run once for testing
     monitor.run_once()
     
     # Uncomment the line below for continuous monitoring
-    # monitor.run_continuous(interval_minutes=30)
+    # monitor.run_continuous()
+    
+    # Or, with WORK_QUEUE set, share the searches with other nodes
+    # monitor.run_distributed()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
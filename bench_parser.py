@@ -0,0 +1,222 @@
+"""Offline benchmark for the search-page parsers.
+
+Runs one or more parsers over recorded pages (debug_page.html by default) and
+synthetic scaled copies of them, and reports throughput, peak memory and
+recall against a golden ID list.
+
+Examples:
+    python bench_parser.py
+    python bench_parser.py --parsers legacy structured --scales 1 10 100
+    python bench_parser.py fixtures/ --parsers structured mymodule:my_extractor
+
+A fixture's golden IDs are read from '<fixture>.golden.json' next to it (a JSON
+list of listing ID strings). Fixtures without one report recall as '-'.
+
+The legacy regexes backtrack badly on real pages (minutes per page on
+debug_page.html), so expect 'legacy' runs at higher scales to take a while.
+"""
+import argparse
+import base64
+import importlib
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+from listing_parser import STATE_SCRIPT_MARKER, extract_listings, find_state_block
+
+
+def legacy_regex_listings(html_content):
+    """The regex extraction AirbnbMonitor.get_listings used before the structured parser"""
+    current_listings = []
+
+    listing_pattern1 = r'"listing":{"id":"(\d+)".*?"name":"([^"]+)"'
+    matches1 = re.findall(listing_pattern1, html_content)
+
+    listing_pattern2 = r'"room":{"id":"(\d+)".*?"name":"([^"]+)"'
+    matches2 = re.findall(listing_pattern2, html_content)
+
+    listing_pattern3 = r'"id":"(\d+)".*?"title":"([^"]+)".*?"roomType"'
+    matches3 = re.findall(listing_pattern3, html_content)
+
+    for listing_id, name in matches1 + matches2 + matches3:
+        if (len(listing_id) > 6 and
+            name not in ['treatment', 'control', 'flags', 'roles'] and
+            not name.startswith('*') and
+            len(name) > 3):
+            current_listings.append({
+                'id': listing_id,
+                'name': name,
+                'url': f'https://www.airbnb.com/rooms/{listing_id}'
+            })
+
+    seen_ids = set()
+    unique_listings = []
+    for listing in current_listings:
+        if listing['id'] not in seen_ids:
+            seen_ids.add(listing['id'])
+            unique_listings.append(listing)
+
+    if len(unique_listings) < 3:
+        simple_matches = re.findall(r'data-testid="listing-(\d+)"', html_content)
+        for listing_id in simple_matches[:10]:
+            unique_listings.append({'id': listing_id, 'name': f'Airbnb Listing {listing_id}'})
+
+    return unique_listings
+
+
+PARSERS = {
+    'legacy': legacy_regex_listings,
+    'structured': extract_listings,
+}
+
+
+def resolve_parser(spec):
+    """Look up a parser by registry name or 'module:function' path"""
+    if spec in PARSERS:
+        return PARSERS[spec]
+    module_name, _, func_name = spec.partition(':')
+    if not func_name:
+        raise ValueError(f"Unknown parser '{spec}' (use one of {', '.join(PARSERS)} or module:function)")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def load_fixtures(paths):
+    """Return [(name, html, golden_ids or None)] for the given files/directories"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.html')))
+        else:
+            files.append(path)
+
+    fixtures = []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            html_content = f.read()
+        golden_ids = None
+        golden_path = os.path.splitext(path)[0] + '.golden.json'
+        if os.path.exists(golden_path):
+            with open(golden_path, 'r') as f:
+                golden_ids = set(json.load(f))
+        fixtures.append((os.path.basename(path), html_content, golden_ids))
+    return fixtures
+
+
+def scale_page(html_content, golden_ids, factor):
+    """Build a synthetic page whose search results are repeated `factor` times.
+
+    Copies get fresh IDs (the originals with a numeric suffix) so recall can
+    still be measured. Returns (html, golden_ids) or None if the page has no
+    deferred state to scale.
+    """
+    if factor == 1:
+        return html_content, golden_ids
+    block = find_state_block(html_content)
+    if block is None:
+        return None
+    state = json.loads(block)
+
+    new_golden = set(golden_ids) if golden_ids is not None else None
+    for entry in state['niobeMinimalClientData']:
+        results = entry[1]['data']['presentation']['staysSearch']['results']
+        originals = results['searchResults']
+        scaled = list(originals)
+        for copy_index in range(1, factor):
+            for result in originals:
+                copy = json.loads(json.dumps(result))
+                demand_listing = copy['demandStayListing']
+                typename, _, listing_id = base64.b64decode(demand_listing['id']).decode('ascii').partition(':')
+                new_id = f"{listing_id}{copy_index:03d}"
+                demand_listing['id'] = base64.b64encode(f"{typename}:{new_id}".encode('ascii')).decode('ascii')
+                scaled.append(copy)
+                if new_golden is not None:
+                    new_golden.add(new_id)
+        results['searchResults'] = scaled
+
+    start = html_content.find(block, html_content.find(STATE_SCRIPT_MARKER))
+    scaled_html = html_content[:start] + json.dumps(state) + html_content[start + len(block):]
+    return scaled_html, new_golden
+
+
+def run_parser(parser, html_content, min_seconds, golden_ids):
+    """Time a parser on one page, then measure its peak memory in a separate traced run"""
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        listings = parser(html_content)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            break
+
+    tracemalloc.start()
+    parser(html_content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    found_ids = {listing['id'] for listing in listings}
+    recall = None
+    if golden_ids:
+        recall = len(found_ids & golden_ids) / len(golden_ids)
+
+    size_mb = len(html_content.encode('utf-8')) / (1024 * 1024)
+    per_page = elapsed / runs
+    return {
+        'listings': len(found_ids),
+        'seconds_per_page': per_page,
+        'pages_per_second': 1 / per_page if per_page else float('inf'),
+        'mb_per_second': size_mb / per_page if per_page else float('inf'),
+        'peak_kib': peak / 1024,
+        'recall': recall,
+        'size_mb': size_mb,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Airbnb search-page parsers offline")
+    parser.add_argument('fixtures', nargs='*', default=['debug_page.html'],
+                        help="recorded page files or directories of .html files")
+    parser.add_argument('--parsers', nargs='+', default=['structured'],
+                        help=f"parsers to compare: {', '.join(PARSERS)} or module:function")
+    parser.add_argument('--scales', nargs='+', type=int, default=[1],
+                        help="synthetic listing-block multipliers, e.g. 1 10 100")
+    parser.add_argument('--min-seconds', type=float, default=1.0,
+                        help="keep re-running each parser for at least this long")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    parsers = [(spec, resolve_parser(spec)) for spec in args.parsers]
+    results = []
+
+    for name, html_content, golden_ids in load_fixtures(args.fixtures):
+        for factor in args.scales:
+            page = scale_page(html_content, golden_ids, factor)
+            if page is None:
+                print(f"Skipping {name} x{factor}: no deferred state to scale", file=sys.stderr)
+                continue
+            page_html, page_golden = page
+            for spec, parse in parsers:
+                stats = run_parser(parse, page_html, args.min_seconds, page_golden)
+                stats.update({'fixture': name, 'scale': factor, 'parser': spec})
+                results.append(stats)
+                if not args.json:
+                    recall = f"{stats['recall']:.0%}" if stats['recall'] is not None else '-'
+                    print(f"{name:<24} x{factor:<4} {spec:<14} {stats['size_mb']:7.2f} MB "
+                          f"{stats['pages_per_second']:9.2f} pages/s {stats['mb_per_second']:9.2f} MB/s "
+                          f"peak {stats['peak_kib']:10.0f} KiB  listings {stats['listings']:5d}  recall {recall}")
+            if not args.json and len(parsers) > 1:
+                baseline = results[-len(parsers)]
+                for stats in results[-len(parsers) + 1:]:
+                    speedup = baseline['seconds_per_page'] / stats['seconds_per_page'] if stats['seconds_per_page'] else float('inf')
+                    print(f"{'':<31} {stats['parser']} vs {baseline['parser']}: {speedup:.1f}x faster")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+logger = logging.getLogger(__name__)
+
+# Starts a navigation in the current tab without waiting for it. The
+# navigation is deferred with setTimeout so the call returns before the old
+# document unloads. It returns the old document's timeOrigin, and a new
+# timeOrigin later shows that the navigation has committed.
+NAVIGATE_JS = r"""
+const url = arguments[0];
+setTimeout(() => { window.location.href = url; }, 0);
+return performance.timeOrigin;
+"""
+
+NAVIGATION_STATE_JS = "return [performance.timeOrigin, document.readyState];"
+
+# Result of a tab that timed out or whose session failed, to be loaded again
+RETRY = object()
+
+
+class PooledBrowser:
+    """One Chrome session in the pool, with its tabs and usage counters"""
+
+    def __init__(self, driver, prepare_tab=None, throttle=None, forget=None):
+        self.driver = driver
+        self.prepare_tab = prepare_tab
+        self.throttle = throttle
+        self.forget = forget
+        self.tabs = [driver.current_window_handle]
+        self.page_loads = 0
+        self.broken = False
+        if prepare_tab:
+            prepare_tab(driver)
+
+    def rss_bytes(self):
+        """Resident memory of chromedriver and every Chrome process under it"""
+        try:
+            root = psutil.Process(self.driver.service.process.pid)
+            total = 0
+            for process in [root] + root.children(recursive=True):
+                try:
+                    total += process.memory_info().rss
+                except psutil.NoSuchProcess:
+                    continue
+            return total
+        except (psutil.Error, AttributeError):
+            return 0
+
+    def responsive(self):
+        """Cheap round trip to check that the session is still alive"""
+        try:
+            self.driver.execute_script("return 1;")
+            return True
+        except WebDriverException:
+            return False
+
+    def ensure_tabs(self, count):
+        while len(self.tabs) < count:
+            self.driver.switch_to.new_window('tab')
+            self.tabs.append(self.driver.current_window_handle)
+            if self.prepare_tab:
+                self.prepare_tab(self.driver)
+
+    def visit_all(self, visit, urls, navigation_timeout):
+        """Load each URL in its own tab at once, then call visit(driver, url) on each tab in turn.
+
+        The pages load in parallel while the earlier tabs are being read. A
+        tab that does not load in time gets RETRY and the other tabs are still
+        read. Any other WebDriverException means the session is broken: it sets
+        `broken`, and that tab and the ones not read yet get RETRY. Any other
+        error only loses that page's result.
+        """
+        results = [RETRY] * len(urls)
+        try:
+            self.ensure_tabs(len(urls))
+            origins = []
+            for handle, url in zip(self.tabs, urls):
+                self.driver.switch_to.window(handle)
+                if self.throttle:
+                    self.throttle()
+                origins.append(self.driver.execute_script(NAVIGATE_JS, url))
+
+            for index, (handle, url, origin) in enumerate(zip(self.tabs, urls, origins)):
+                self.driver.switch_to.window(handle)
+                self.page_loads += 1
+                try:
+                    self._await_navigation(origin, navigation_timeout)
+                    results[index] = visit(self.driver, url)
+                except TimeoutException:
+                    logger.warning(f"Timed out loading {url}")
+                except WebDriverException:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error reading {url}: {e}")
+                    results[index] = None
+        except WebDriverException as e:
+            logger.warning(f"Browser session failed ({e.__class__.__name__})")
+            self.broken = True
+        if self.forget:
+            self.forget(self.driver.session_id)
+        return results
+
+    def quit(self):
+        if self.forget:
+            self.forget(self.driver.session_id)
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error closing browser: {e}")
+
+    def _await_navigation(self, old_origin, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            origin, ready_state = self.driver.execute_script(NAVIGATION_STATE_JS)
+            if origin != old_origin and ready_state != 'loading':
+                return
+            if time.monotonic() >= deadline:
+                raise TimeoutException(f"Navigation did not commit within {timeout}s")
+            time.sleep(0.05)
+
+
+class BrowserPool:
+    """Warm headless Chrome sessions reused across checks.
+
+    Searches are loaded in batches of up to `tabs` tabs per browser, with up
+    to `size` browsers working at once. A browser is retired after
+    `max_page_loads` page loads, or once its process tree passes `max_rss_mb`,
+    so memory cannot creep forever. warm() replaces retired browsers between
+    cycles, which keeps Chrome startup off the next check. A session that
+    crashes is discarded. The searches of a batch that timed out or were
+    lost with a session are retried once, in another acquired browser.
+    prepare_tab(driver), if given, runs once in every new tab, and
+    throttle(), if given, is called before every navigation. forget(session_id),
+    if given, is called after each batch and when a browser quits.
+    """
+
+    def __init__(self, create_driver, size=1, tabs=4, max_page_loads=100, max_rss_mb=1500,
+                 navigation_timeout=60, prepare_tab=None, throttle=None, forget=None):
+        self.create_driver = create_driver
+        self.prepare_tab = prepare_tab
+        self.throttle = throttle
+        self.forget = forget
+        self.size = max(1, size)
+        self.tabs = max(1, tabs)
+        self.max_page_loads = max_page_loads
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.navigation_timeout = navigation_timeout
+
+        self.started = 0
+        self.recycled = 0
+        self.replaced = 0
+        self.page_loads = 0
+        self._idle = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        # chromedriver downloads and Chrome startups are done one at a time
+        self._start_lock = threading.Lock()
+
+    def warm(self):
+        """Start browsers until `size` are idle and ready"""
+        while True:
+            with self._lock:
+                if len(self._idle) + self._busy >= self.size:
+                    return
+            browser = self._start()
+            if browser is None:
+                return
+            with self._lock:
+                self._idle.append(browser)
+
+    def map(self, visit, urls):
+        """Call visit(driver, url) on every URL, returning results in order (None where it failed)"""
+        urls = list(urls)
+        batches = [urls[i:i + self.tabs] for i in range(0, len(urls), self.tabs)]
+        if not batches:
+            return []
+
+        workers = min(self.size, len(batches))
+        if workers == 1:
+            batch_results = [self._run_batch(visit, batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='browser') as executor:
+                batch_results = list(executor.map(lambda batch: self._run_batch(visit, batch), batches))
+        return [result for results in batch_results for result in results]
+
+    def rss_bytes(self):
+        """Resident memory of the idle browsers' process trees"""
+        with self._lock:
+            idle = list(self._idle)
+        return sum(browser.rss_bytes() for browser in idle)
+
+    def summary(self):
+        return (f"Browser pool: {self.started} started, {self.recycled} recycled, "
+                f"{self.replaced} replaced after failures, {self.page_loads} page loads")
+
+    def close(self):
+        """Quit every idle browser"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            browser.quit()
+
+    def _run_batch(self, visit, batch):
+        results = [None] * len(batch)
+        pending = list(range(len(batch)))
+        for attempt in range(2):
+            browser = self._acquire()
+            if browser is None:
+                break
+            attempted = browser.visit_all(visit, [batch[index] for index in pending], self.navigation_timeout)
+            with self._lock:
+                self.page_loads += len(pending)
+            retry = []
+            for index, result in zip(pending, attempted):
+                if result is RETRY:
+                    retry.append(index)
+                else:
+                    results[index] = result
+            if browser.broken:
+                logger.warning("Replacing the failed browser")
+                self._discard(browser)
+                with self._lock:
+                    self.replaced += 1
+            else:
+                self._release(browser)
+            pending = retry
+            if not pending:
+                break
+            if attempt == 0:
+                logger.info(f"Retrying {len(pending)} of {len(batch)} searches in the batch")
+        return results
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                browser = self._idle.pop() if self._idle else None
+                self._busy += 1
+            if browser is None:
+                browser = self._start()
+                if browser is None:
+                    with self._lock:
+                        self._busy -= 1
+                return browser
+            if browser.responsive():
+                return browser
+            logger.warning("Idle browser stopped responding; replacing it")
+            self._discard(browser)
+            with self._lock:
+                self.replaced += 1
+
+    def _release(self, browser):
+        rss = browser.rss_bytes()
+        if browser.page_loads >= self.max_page_loads or (self.max_rss_bytes and rss > self.max_rss_bytes):
+            logger.info(f"Recycling browser after {browser.page_loads} page loads ({rss / 1024 / 1024:.0f} MB)")
+            with self._lock:
+                self.recycled += 1
+            self._discard(browser)
+            return
+        with self._lock:
+            self._idle.append(browser)
+            self._busy -= 1
+
+    def _discard(self, browser):
+        browser.quit()
+        with self._lock:
+            self._busy -= 1
+
+    def _start(self):
+        with self._start_lock:
+            try:
+                driver = self.create_driver()
+            except Exception as e:
+                logger.error(f"Error starting browser: {e}")
+                return None
+        try:
+            driver.set_page_load_timeout(self.navigation_timeout)
+            browser = PooledBrowser(driver, self.prepare_tab, self.throttle, self.forget)
+        except WebDriverException as e:
+            logger.error(f"Error preparing browser: {e}")
+            driver.quit()
+            return None
+        with self._lock:
+            self.started += 1
+        return browser
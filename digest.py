@@ -0,0 +1,149 @@
+import html
+import io
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# Gmail clips messages whose HTML body passes ~102 KB; stay well under it
+MAX_DIGEST_BYTES = 90_000
+MAX_DIGEST_LISTINGS = 50
+
+HTML_HEADER = """<h2>{heading}</h2>
+<p>{intro}{part_note}:</p>
+<br>
+"""
+
+HTML_CARD = """<div style="border: 1px solid #ddd; padding: 20px; margin: 15px 0; border-radius: 8px; background-color: #fafafa;">
+<div style="display: flex; align-items: flex-start; gap: 15px;">
+{image}<div style="flex-grow: 1;">
+<h3 style="margin: 0 0 8px 0; color: #222; font-size: 16px;">{name}</h3>
+<p style="margin: 5px 0; color: #666; font-size: 14px;"><strong>Price:</strong> <span style="color: #ff5a5f; font-weight: bold;">{price}</span></p>
+<p style="margin: 5px 0; color: #666; font-size: 14px;"><strong>ID:</strong> {id}</p>
+<p style="margin: 10px 0 0 0;"><a href="{url}" style="color: #ff5a5f; text-decoration: none; font-weight: bold; background-color: #fff; padding: 8px 16px; border: 2px solid #ff5a5f; border-radius: 4px; display: inline-block;">📍 View Listing</a></p>
+</div>
+</div>
+</div>
+"""
+
+HTML_IMAGE = """<div style="flex-shrink: 0;">
+<img src="{src}" alt="Property image" style="width: 120px; height: 90px; object-fit: cover; border-radius: 6px; border: 1px solid #ddd;">
+</div>
+"""
+
+HTML_FOOTER = """<br>
+<p style="color: #666; font-size: 12px;">
+{footer}
+</p>
+"""
+
+TEXT_HEADER = "{heading}\n{intro}{part_note}:\n\n"
+TEXT_CARD = "{name}\n  Price: {price}\n  ID: {id}\n  {url}\n\n"
+TEXT_FOOTER = "{footer}\n"
+
+
+class DigestPart:
+    """One rendered email body: HTML and plain-text versions of a slice of the listings"""
+
+    def __init__(self, html_body, text_body, count):
+        self.html = html_body
+        self.text = text_body
+        self.count = count
+
+
+def _render_card(listing):
+    """Render one listing as (html, text); each template is formatted once per listing"""
+    name = listing.get('name') or f"Listing {listing['id']}"
+    price = listing.get('price') or 'Price not available'
+    image_url = listing.get('image_url')
+    fields = {
+        'name': html.escape(name),
+        'price': html.escape(price),
+        'id': html.escape(str(listing['id'])),
+        'url': html.escape(listing['url'], quote=True),
+        'image': HTML_IMAGE.format(src=html.escape(image_url, quote=True)) if image_url else '',
+    }
+    text = TEXT_CARD.format(name=name, price=price, id=listing['id'], url=listing['url'])
+    return HTML_CARD.format_map(fields), text
+
+
+def render_digests(listings, heading, footer=None, max_bytes=MAX_DIGEST_BYTES, max_listings=MAX_DIGEST_LISTINGS,
+                   intro=None):
+    """Stream listing cards into size-bounded digest parts.
+
+    A new part starts whenever adding the next card would push the HTML body
+    past `max_bytes` (UTF-8) or the part past `max_listings` cards. Every part
+    holds at least one card. Cards are written to a buffer once, so the cost is
+    linear in the number of listings.
+    """
+    if footer is None:
+        footer = f"Alert sent at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    total = len(listings)
+    if intro is None:
+        intro = f"Found {total} new listing(s) matching your search criteria"
+    footer_html = HTML_FOOTER.format(footer=html.escape(footer))
+    footer_text = TEXT_FOOTER.format(footer=footer)
+    # Room for the header (with a part note) and footer in every part
+    overhead = len(HTML_HEADER.format(heading=heading, intro=html.escape(intro),
+                                      part_note=' (part 000 of 000)').encode('utf-8'))
+    overhead += len(footer_html.encode('utf-8'))
+
+    chunks = []
+    html_buffer, text_buffer = io.StringIO(), io.StringIO()
+    size = overhead
+    count = 0
+    for listing in listings:
+        card_html, card_text = _render_card(listing)
+        card_size = len(card_html.encode('utf-8'))
+        if count and (size + card_size > max_bytes or count >= max_listings):
+            chunks.append((html_buffer.getvalue(), text_buffer.getvalue(), count))
+            html_buffer, text_buffer = io.StringIO(), io.StringIO()
+            size = overhead
+            count = 0
+        html_buffer.write(card_html)
+        text_buffer.write(card_text)
+        size += card_size
+        count += 1
+    if count:
+        chunks.append((html_buffer.getvalue(), text_buffer.getvalue(), count))
+
+    parts = []
+    for number, (cards_html, cards_text, count) in enumerate(chunks, 1):
+        part_note = f" (part {number} of {len(chunks)})" if len(chunks) > 1 else ''
+        parts.append(DigestPart(
+            HTML_HEADER.format(heading=heading, intro=html.escape(intro), part_note=part_note) + cards_html + footer_html,
+            TEXT_HEADER.format(heading=heading, intro=intro, part_note=part_note) + cards_text + footer_text,
+            count,
+        ))
+    return parts
+
+
+def change_listings(events):
+    """Turn change events from SnapshotStore.diff into listing cards whose name says what changed"""
+    labels = {
+        'price_dropped': lambda event: f"Price dropped {event['old']} → {event['new']}",
+        'price_increased': lambda event: f"Price rose {event['old']} → {event['new']}",
+        'title_changed': lambda event: f"Renamed from \"{event['old']}\"",
+        'relisted': lambda event: f"Back after {(event['new'] - event['old']) // 86400} days",
+    }
+    cards = []
+    for event in events:
+        listing = event['listing']
+        cards.append(dict(listing, name=f"{labels[event['kind']](event)}: {listing.get('name') or listing['id']}"))
+    return cards
+
+
+def build_digest_messages(listings, sender_email, recipient_email, subject, heading, footer=None,
+                          max_bytes=MAX_DIGEST_BYTES, max_listings=MAX_DIGEST_LISTINGS, intro=None):
+    """Render the listings into one or more multipart/alternative messages ready to send"""
+    parts = render_digests(listings, heading, footer, max_bytes, max_listings, intro)
+    messages = []
+    for number, part in enumerate(parts, 1):
+        msg = MIMEMultipart('alternative')
+        msg['From'] = sender_email
+        msg['To'] = recipient_email
+        msg['Subject'] = subject if len(parts) == 1 else f"{subject} ({number}/{len(parts)})"
+        # Plain text first: clients show the last alternative they can render
+        msg.attach(MIMEText(part.text, 'plain', 'utf-8'))
+        msg.attach(MIMEText(part.html, 'html', 'utf-8'))
+        messages.append((msg, part.count))
+    return messages
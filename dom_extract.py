@@ -0,0 +1,154 @@
+import json
+import logging
+
+from listing_parser import STATE_KEY, extract_listings, parse_state_block
+
+logger = logging.getLogger(__name__)
+
+# Runs inside the page and returns every card as JSON in a single WebDriver call.
+# It applies the same selector fallbacks the monitors used to try one
+# find_element call at a time: the first card selector that yields listings
+# wins, then the first price text with a currency, then the first usable image.
+EXTRACT_CARDS_JS = r"""
+const listingSelectors = [
+    "[data-testid='card-container']",
+    "[data-testid='listing-card-title']",
+    "div[itemProp='itemListElement']",
+    "a[href*='/rooms/']",
+    "div[data-testid='card-container'] a"
+];
+const titleSelectors = [
+    "[data-testid='listing-card-title']",
+    "div[data-testid='listing-card-title']"
+];
+const priceSelectors = [
+    "[data-testid='price-availability']",
+    "span._1y74zjx",
+    "span[data-testid='price']",
+    "div._1jo4hgw span",
+    "span",
+    "div[data-testid='price-availability'] span"
+];
+const imageSelectors = [
+    "img[data-testid='listing-card-image']",
+    "img[data-original]",
+    "img[src*='airbnb']",
+    "picture img",
+    "img"
+];
+const currencies = ['kr', '$', '€', '£', 'DKK'];
+
+function textOf(el) {
+    return (el.innerText || el.textContent || '').trim();
+}
+
+function extractCard(element) {
+    const link = element.tagName === 'A' ? element : element.querySelector("a[href*='/rooms/']");
+    const url = link && link.href;
+    if (!url || !url.includes('/rooms/')) {
+        return null;
+    }
+    const id = url.split('/rooms/').pop().split('?')[0].split('/')[0];
+
+    let title = null;
+    for (const selector of titleSelectors) {
+        const titleElement = element.querySelector(selector);
+        if (titleElement) {
+            title = textOf(titleElement);
+            break;
+        }
+    }
+
+    let price = null;
+    for (const selector of priceSelectors) {
+        for (const priceElement of element.querySelectorAll(selector)) {
+            const priceText = textOf(priceElement);
+            if (priceText && currencies.some(currency => priceText.includes(currency))) {
+                price = priceText;
+                break;
+            }
+        }
+        if (price) {
+            break;
+        }
+    }
+
+    let image = null;
+    for (const selector of imageSelectors) {
+        const img = element.querySelector(selector);
+        const src = img && (img.src || img.getAttribute('data-original'));
+        if (src && (src.includes('airbnb') || src.includes('https://'))) {
+            image = src;
+            break;
+        }
+    }
+
+    return {id: id, url: url, title: title, price: price, image_url: image};
+}
+
+for (const selector of listingSelectors) {
+    const elements = document.querySelectorAll(selector);
+    const cards = [];
+    for (const element of elements) {
+        const card = extractCard(element);
+        if (card) {
+            cards.push(card);
+        }
+    }
+    if (cards.length) {
+        return JSON.stringify({selector: selector, elements: elements.length, cards: cards});
+    }
+}
+return JSON.stringify({selector: null, elements: 0, cards: []});
+"""
+
+# Returns the text of the deferred-state script that carries the search
+# results, the same JSON the HTTP backend finds in the raw page, or null
+READ_STATE_JS = r"""
+const stateKey = arguments[0];
+for (const script of document.querySelectorAll('script[id^="data-deferred-state"]')) {
+    const text = script.textContent;
+    if (text.slice(0, 64).includes(stateKey)) {
+        return text;
+    }
+}
+return null;
+"""
+
+
+def read_state_listings(driver, source='state'):
+    """Return the page's listings in the same records the HTTP backend produces, or [] if it has no state.
+
+    `source` picks what crosses the WebDriver connection, once per page:
+    'state' reads only the deferred-state JSON and 'page_source' serializes
+    the whole document. Both are parsed by listing_parser. The state is part
+    of the server-rendered HTML, so it can be read as soon as the document
+    has been parsed, without waiting for the cards to render.
+    """
+    if source == 'page_source':
+        return extract_listings(driver.page_source)
+    block = driver.execute_script(READ_STATE_JS, STATE_KEY)
+    return parse_state_block(block) if block else []
+
+
+def extract_cards(driver):
+    """Collect id, url, title, price and image of every listing card in one execute_script call"""
+    result = json.loads(driver.execute_script(EXTRACT_CARDS_JS))
+    if result['selector']:
+        logger.info(f"Found {result['elements']} elements with selector: {result['selector']}")
+
+    unique_listings = []
+    seen_ids = set()
+    for card in result['cards']:
+        listing_id = card['id']
+        if not listing_id or len(listing_id) <= 3 or listing_id in seen_ids:  # Valid, unique listing ID
+            continue
+        seen_ids.add(listing_id)
+        unique_listings.append({
+            'id': listing_id,
+            'name': card['title'] or f"Airbnb Listing {listing_id}",
+            'url': card['url'],
+            'price': card['price'],
+            'image_url': card['image_url'],
+        })
+    return unique_listings
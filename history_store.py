@@ -0,0 +1,246 @@
+"""Append-only columnar history of listing observations.
+
+Every cycle appends one row per (cycle, search, listing) to the newest
+segment of the history directory. Each column of a segment is a raw
+little-endian array in its own file, e.g. history/000003.price, so
+queries memory-map only the columns they use. A segment is sealed once
+it holds SEGMENT_ROWS rows.
+
+    python history_store.py median-price --search default --days 90
+    python history_store.py lifetimes --search default
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from seen_index import is_indexable
+from snapshot_store import price_value
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = 'history'
+SEGMENT_ROWS = 1 << 20
+
+COLUMNS = {
+    'ts': np.dtype('<u4'),
+    'search': np.dtype('<u2'),
+    'listing': np.dtype('<u8'),
+    'price': np.dtype('<f4'),
+    'rating': np.dtype('<f4'),
+    'reviews': np.dtype('<i4'),
+    'latitude': np.dtype('<f4'),
+    'longitude': np.dtype('<f4'),
+}
+
+
+def _column_values(listings, column):
+    if column == 'listing':
+        return [int(listing['id']) for listing in listings]
+    if column == 'price':
+        return [price_value(listing.get('price')) or np.nan for listing in listings]
+    if column == 'reviews':
+        return [listing.get('review_count') if listing.get('review_count') is not None else -1 for listing in listings]
+    if column == 'rating':
+        return [listing.get('rating') if listing.get('rating') is not None else np.nan for listing in listings]
+    return [listing.get(column) if listing.get(column) is not None else np.nan for listing in listings]
+
+
+class HistoryStore:
+    """Writes observation rows in per-cycle batches and answers vectorized queries over the segments"""
+
+    def __init__(self, path=HISTORY_DIR, segment_rows=SEGMENT_ROWS):
+        self.path = path
+        self.segment_rows = segment_rows
+        os.makedirs(path, exist_ok=True)
+        self.codes_path = os.path.join(path, 'searches.json')
+        self.search_codes = {}
+        if os.path.exists(self.codes_path):
+            with open(self.codes_path, 'r') as f:
+                self.search_codes = json.load(f)
+        self.segment, self.rows = self._open_active()
+
+    def search_code(self, key):
+        """Small integer code of a search, assigned on first use"""
+        if key not in self.search_codes:
+            self.search_codes[key] = len(self.search_codes)
+            tmp_path = f"{self.codes_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.search_codes, f)
+            os.replace(tmp_path, self.codes_path)
+        return self.search_codes[key]
+
+    def append_cycle(self, results, now=None):
+        """Append one row per listing of each (search, listings) pair, with one write and fsync per column"""
+        now = int(now if now is not None else time.time())
+        batches = []
+        for search, listings in results:
+            listings = [listing for listing in listings if is_indexable(str(listing.get('id') or ''))]
+            if listings:
+                batches.append((self.search_code(search.get('id') or search['url']), listings))
+        total = sum(len(listings) for _, listings in batches)
+        if not total:
+            return 0
+
+        columns = {
+            'ts': np.full(total, now, dtype=COLUMNS['ts']),
+            'search': np.concatenate([np.full(len(listings), code, dtype=COLUMNS['search'])
+                                      for code, listings in batches]),
+        }
+        all_listings = [listing for _, listings in batches for listing in listings]
+        for column, dtype in COLUMNS.items():
+            if column not in columns:
+                columns[column] = np.asarray(_column_values(all_listings, column), dtype=dtype)
+
+        if self.rows + total > self.segment_rows and self.rows:
+            self.segment += 1
+            self.rows = 0
+        for column, values in columns.items():
+            with open(self._column_path(self.segment, column), 'ab') as f:
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.rows += total
+        return total
+
+    def segments(self):
+        return sorted(int(os.path.basename(path).split('.')[0])
+                      for path in glob.glob(os.path.join(self.path, '*.ts')))
+
+    def scan(self, columns, search=None, since=None, until=None):
+        """Yield {column: array} per segment for the matching rows, memory-mapping only what is needed.
+
+        `search` is a search key, `since`/`until` are Unix times. Segments
+        whose time range cannot match are skipped without reading their
+        other columns.
+        """
+        code = self.search_codes.get(search) if search is not None else None
+        if search is not None and code is None:
+            return
+        for segment in self.segments():
+            ts = self._column(segment, 'ts')
+            if not len(ts) or (since is not None and ts[-1] < since) or (until is not None and ts[0] > until):
+                continue
+            mask = np.ones(len(ts), dtype=bool)
+            if since is not None:
+                mask &= ts >= since
+            if until is not None:
+                mask &= ts <= until
+            if code is not None:
+                mask &= self._column(segment, 'search')[:len(ts)] == code
+            if not mask.any():
+                continue
+            yield {column: np.asarray(self._column(segment, column)[:len(ts)][mask]) for column in columns}
+
+    def count(self, search=None, since=None, until=None):
+        return sum(len(chunk['ts']) for chunk in self.scan(['ts'], search, since, until))
+
+    def median_price(self, search=None, days=90, now=None):
+        """Median observed price over the last `days` days (NaN when there is none)"""
+        return self.price_quantile(0.5, search, days, now)
+
+    def price_quantile(self, q, search=None, days=90, now=None):
+        since = int(now if now is not None else time.time()) - int(days * 86400)
+        prices = [chunk['price'] for chunk in self.scan(['price'], search, since)]
+        prices = np.concatenate(prices) if prices else np.empty(0, dtype=COLUMNS['price'])
+        prices = prices[~np.isnan(prices)]
+        return float(np.quantile(prices, q)) if len(prices) else float('nan')
+
+    def daily_median_price(self, search=None, days=90, now=None):
+        """[(day start, median price)] for each day with prices"""
+        since = int(now if now is not None else time.time()) - int(days * 86400)
+        days_column, prices = [], []
+        for chunk in self.scan(['ts', 'price'], search, since):
+            keep = ~np.isnan(chunk['price'])
+            days_column.append(chunk['ts'][keep] // 86400)
+            prices.append(chunk['price'][keep])
+        days_column, prices = np.concatenate(days_column or [[]]), np.concatenate(prices or [[]])
+        if not len(prices):
+            return []
+        order = np.lexsort((prices, days_column))
+        days_column, prices = days_column[order], prices[order]
+        starts = np.flatnonzero(np.r_[True, days_column[1:] != days_column[:-1]])
+        ends = np.r_[starts[1:], len(days_column)]
+        return [(int(days_column[start]) * 86400, float(np.median(prices[start:end])))
+                for start, end in zip(starts, ends)]
+
+    def lifetimes(self, search=None, since=None):
+        """(listing ids, first seen, last seen) arrays; memory follows distinct listings, not rows"""
+        ids, first, last = np.empty(0, COLUMNS['listing']), np.empty(0, COLUMNS['ts']), np.empty(0, COLUMNS['ts'])
+        for chunk in self.scan(['listing', 'ts'], search, since):
+            ids = np.concatenate([ids, chunk['listing']])
+            first = np.concatenate([first, chunk['ts']])
+            last = np.concatenate([last, chunk['ts']])
+            ids, first, last = _reduce_lifetimes(ids, first, last)
+        return ids, first, last
+
+    def _open_active(self):
+        """Find the newest segment and cut its columns back to the last complete row"""
+        segments = self.segments()
+        if not segments:
+            return 0, 0
+        segment = segments[-1]
+        rows = min(os.path.getsize(self._column_path(segment, column)) // dtype.itemsize
+                   if os.path.exists(self._column_path(segment, column)) else 0
+                   for column, dtype in COLUMNS.items())
+        for column, dtype in COLUMNS.items():
+            path = self._column_path(segment, column)
+            if os.path.exists(path) and os.path.getsize(path) != rows * dtype.itemsize:
+                logger.warning(f"Dropping torn rows at the end of {path}")
+                with open(path, 'r+b') as f:
+                    f.truncate(rows * dtype.itemsize)
+            elif not os.path.exists(path):
+                open(path, 'wb').close()
+        if rows >= self.segment_rows:
+            return segment + 1, 0
+        return segment, rows
+
+    def _column(self, segment, column):
+        path = self._column_path(segment, column)
+        if not os.path.getsize(path):
+            return np.empty(0, dtype=COLUMNS[column])
+        return np.memmap(path, dtype=COLUMNS[column], mode='r')
+
+    def _column_path(self, segment, column):
+        return os.path.join(self.path, f"{segment:06d}.{column}")
+
+
+def _reduce_lifetimes(ids, first, last):
+    order = np.argsort(ids, kind='stable')
+    ids, first, last = ids[order], first[order], last[order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    return ids[starts], np.minimum.reduceat(first, starts), np.maximum.reduceat(last, starts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the listing history')
+    parser.add_argument('query', choices=['median-price', 'daily-price', 'lifetimes', 'count'])
+    parser.add_argument('--search', help='search id from searches.json (default: all searches)')
+    parser.add_argument('--days', type=float, default=90)
+    parser.add_argument('--path', default=HISTORY_DIR)
+    args = parser.parse_args()
+
+    store = HistoryStore(args.path)
+    if args.query == 'median-price':
+        print(f"Median price over {args.days:g} days: {store.median_price(args.search, args.days):.0f}")
+    elif args.query == 'daily-price':
+        for day, price in store.daily_median_price(args.search, args.days):
+            print(f"{time.strftime('%Y-%m-%d', time.gmtime(day))}  {price:.0f}")
+    elif args.query == 'lifetimes':
+        ids, first, last = store.lifetimes(args.search)
+        if not len(ids):
+            print("No listings recorded")
+            return
+        days_up = (last.astype(np.int64) - first) / 86400
+        print(f"{len(ids)} listings; days listed: median {np.median(days_up):.1f}, "
+              f"mean {days_up.mean():.1f}, 90th percentile {np.quantile(days_up, 0.9):.1f}")
+    else:
+        print(f"{store.count(args.search, time.time() - args.days * 86400)} observations in {args.days:g} days")
+
+
+if __name__ == "__main__":
+    main()
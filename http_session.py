@@ -0,0 +1,139 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.request import ACCEPT_ENCODING
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def traffic_summary(stats):
+    """One-line description of the traffic in a stats dict (requests, handshakes, not_modified, bytes)"""
+    ratio = stats['bytes_decoded'] / stats['bytes_on_wire'] if stats['bytes_on_wire'] else 0
+    return (f"HTTP: {stats['requests']} requests, {stats['handshakes']} handshakes, "
+            f"{stats['not_modified']} not modified, {stats['bytes_on_wire'] / 1024:.0f} KiB on wire "
+            f"({stats['bytes_decoded'] / 1024:.0f} KiB decoded, {ratio:.1f}x compression)")
+
+
+class _ConnectionCounter:
+    """Thread-safe count of new connections (each one is a TCP, and for https a TLS, handshake)"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+def _counting_pool(pool_class, counter):
+    class CountingPool(pool_class):
+        def _new_conn(self):
+            counter.increment()
+            return super()._new_conn()
+    return CountingPool
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new connection to a counter"""
+
+    def __init__(self, counter, **kwargs):
+        self.counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self.counter),
+            'https': _counting_pool(HTTPSConnectionPool, self.counter),
+        }
+
+
+class MonitorSession:
+    """Long-lived HTTP session for the requests backend.
+
+    Keeps connections alive between polls, revalidates pages with
+    ETag/If-Modified-Since, and advertises every content encoding urllib3 can
+    decode here (brotli and zstd when their packages are installed). With a
+    RateLimiter, every request waits for a token and a 429 slows it down.
+    """
+
+    def __init__(self, headers, pool_size=4, limiter=None):
+        self.limiter = limiter
+        self.counter = _ConnectionCounter()
+        self.session = requests.Session()
+        adapter = CountingAdapter(self.counter, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.session.headers.update(headers)
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING.replace(',', ', ')
+
+        # url -> (etag, last_modified, text) of the last full response
+        self.validators = {}
+
+        self.stats = {
+            'requests': 0,
+            'not_modified': 0,
+            'bytes_on_wire': 0,
+            'bytes_decoded': 0,
+        }
+
+    @property
+    def handshakes(self):
+        return self.counter.count
+
+    def get(self, url, timeout=30):
+        """GET a page, returning its text; a 304 returns the previously cached body"""
+        headers = {}
+        cached = self.validators.get(url)
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        if self.limiter:
+            self.limiter.acquire()
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        self.stats['requests'] += 1
+        METRICS.count('http_requests', status=response.status_code)
+        if self.limiter:
+            if response.status_code == 429:
+                self.limiter.penalize(f"429 for {url}")
+            elif response.ok:
+                self.limiter.reward()
+
+        if response.status_code == 304 and cached:
+            self.stats['not_modified'] += 1
+            logger.info("Search page not modified since last poll")
+            return cached[2]
+
+        response.raise_for_status()
+        content = response.content
+        # raw.tell() counts bytes read off the socket, i.e. before decompression
+        self.stats['bytes_on_wire'] += response.raw.tell() or len(content)
+        METRICS.count('http_bytes', response.raw.tell() or len(content))
+        self.stats['bytes_decoded'] += len(content)
+
+        text = response.text
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.validators[url] = (etag, last_modified, text)
+        else:
+            self.validators.pop(url, None)
+        return text
+
+    def summary(self):
+        """One-line description of the traffic so far"""
+        return traffic_summary(dict(self.stats, handshakes=self.handshakes))
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,172 @@
+import base64
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Airbnb ships the search results as JSON inside a deferred-state script tag:
+#   <script id="data-deferred-state-0" ... type="application/json">{"niobeMinimalClientData": [...]}</script>
+STATE_SCRIPT_MARKER = 'id="data-deferred-state'
+STATE_KEY = 'niobeMinimalClientData'
+
+
+def find_state_block(html_content):
+    """Return the raw JSON text of the deferred-state script, or None.
+
+    Uses plain substring searches so the whole page is scanned once, left to right,
+    without any regex backtracking.
+    """
+    pos = html_content.find(STATE_SCRIPT_MARKER)
+    while pos != -1:
+        tag_end = html_content.find('>', pos)
+        if tag_end == -1:
+            return None
+        body_end = html_content.find('</script>', tag_end)
+        if body_end == -1:
+            return None
+        body = html_content[tag_end + 1:body_end]
+        # Several deferred-state blocks can exist; only one carries the search data
+        if STATE_KEY in body[:64]:
+            return body
+        pos = html_content.find(STATE_SCRIPT_MARKER, body_end)
+    return None
+
+
+def decode_listing_id(encoded_id):
+    """Turn a relay ID like base64('DemandStayListing:123') into '123'"""
+    if not encoded_id:
+        return None
+    if encoded_id.isdigit():
+        return encoded_id
+    try:
+        decoded = base64.b64decode(encoded_id).decode('ascii')
+    except Exception:
+        return None
+    listing_id = decoded.rsplit(':', 1)[-1]
+    return listing_id if listing_id.isdigit() else None
+
+
+def parse_rating(label):
+    """Turn '4.86 (76)' into (4.86, 76); 'New' and missing values become (None, None)"""
+    if not label:
+        return None, None
+    rating_part, _, count_part = label.partition(' (')
+    try:
+        rating = float(rating_part.replace(',', '.'))
+    except ValueError:
+        return None, None
+    count_digits = ''.join(ch for ch in count_part if ch.isdigit())
+    return rating, int(count_digits) if count_digits else None
+
+
+def _stays_search(state):
+    """Yield the staysSearch payloads contained in a decoded deferred-state object"""
+    for entry in state.get(STATE_KEY) or []:
+        if not isinstance(entry, list) or len(entry) < 2:
+            continue
+        query_name, payload = entry[0], entry[1]
+        if not isinstance(query_name, str) or not query_name.startswith('StaysSearch'):
+            continue
+        stays_search = (((payload or {}).get('data') or {}).get('presentation') or {}).get('staysSearch')
+        if stays_search:
+            yield stays_search
+
+
+def _listing_from_result(result):
+    """Build a listing record from one StaySearchResult, or None if it has no ID"""
+    demand_listing = result.get('demandStayListing') or {}
+    listing_id = decode_listing_id(demand_listing.get('id'))
+    if not listing_id:
+        listing_id = decode_listing_id((result.get('listing') or {}).get('id'))
+    if not listing_id:
+        return None
+
+    name = (((demand_listing.get('description') or {}).get('name') or {})
+            .get('localizedStringWithTranslationPreference'))
+
+    price_line = (result.get('structuredDisplayPrice') or {}).get('primaryLine') or {}
+    price = price_line.get('price') or price_line.get('discountedPrice') or price_line.get('originalPrice')
+    if price:
+        price = price.replace('\xa0', ' ')
+
+    rating, review_count = parse_rating(result.get('avgRatingLocalized'))
+
+    coordinate = (demand_listing.get('location') or {}).get('coordinate') or {}
+
+    pictures = result.get('contextualPictures') or []
+    image_url = pictures[0].get('picture') if pictures else None
+
+    return {
+        'id': listing_id,
+        'name': name or result.get('title') or f"Airbnb Listing {listing_id}",
+        'title': result.get('title'),
+        'url': f'https://www.airbnb.com/rooms/{listing_id}',
+        'price': price,
+        'rating': rating,
+        'review_count': review_count,
+        'latitude': coordinate.get('latitude'),
+        'longitude': coordinate.get('longitude'),
+        'image_url': image_url,
+    }
+
+
+def listings_from_state(state):
+    """Walk a decoded deferred-state object and return unique listing records in page order"""
+    listings = []
+    seen_ids = set()
+    for stays_search in _stays_search(state):
+        results = (stays_search.get('results') or {}).get('searchResults') or []
+        map_results = (stays_search.get('mapResults') or {}).get('mapSearchResults') or []
+        for result in results + map_results:
+            if not isinstance(result, dict):
+                continue
+            listing = _listing_from_result(result)
+            if listing and listing['id'] not in seen_ids:
+                seen_ids.add(listing['id'])
+                listings.append(listing)
+    return listings
+
+
+def page_cursors_from_state(state):
+    """Return the cursors of every results page, first page included ([] if the search has one page)"""
+    for stays_search in _stays_search(state):
+        pagination = (stays_search.get('results') or {}).get('paginationInfo') or {}
+        if pagination.get('pageCursors'):
+            return list(pagination['pageCursors'])
+    return []
+
+
+def _decode_state(block):
+    try:
+        return json.loads(block)
+    except ValueError as e:
+        logger.warning(f"Could not decode deferred-state block: {e}")
+        return None
+
+
+def parse_state_block(block):
+    """Decode the JSON text of a deferred-state script and return its listings ([] if it is not valid JSON)"""
+    state = _decode_state(block)
+    return listings_from_state(state) if state is not None else []
+
+
+def parse_search_page(html_content):
+    """Return (listings, page cursors) from a search page, decoding its state once"""
+    block = find_state_block(html_content)
+    state = _decode_state(block) if block is not None else None
+    if state is None:
+        return [], []
+    return listings_from_state(state), page_cursors_from_state(state)
+
+
+def extract_listings(html_content):
+    """Extract listings from a search page's embedded state in a single pass.
+
+    Returns an empty list when the page carries no deferred state (blocked page,
+    captcha, layout change), so callers can fall back or warn.
+    """
+    block = find_state_block(html_content)
+    if block is None:
+        logger.debug("No deferred-state block found in page")
+        return []
+    return parse_state_block(block)
@@ -0,0 +1,204 @@
+"""Stage timings, counters and gauges, served on /metrics and summarised per cycle.
+
+Code anywhere in the monitor records into the module-level METRICS
+registry:
+
+    with METRICS.stage('fetch'):
+        ...
+    METRICS.count('listings', len(listings))
+    METRICS.gauge('seen_set_size', len(seen))
+
+serve(port) exposes the registry in the Prometheus text format on
+http://localhost:<port>/metrics. end_cycle() returns what the last cycle
+did (time per stage, counter increases, current gauges) as a dict, which
+the monitors log and append to a JSON-lines file. Worker processes
+hand what they recorded to the parent with take(), which adds it to its
+own registry with merge().
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'airbnb_monitor_'
+
+# Upper bounds in seconds; stages range from a parse (ms) to a full browser cycle (minutes)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}'
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Metrics:
+    """Thread-safe registry of stage histograms, counters and gauges"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> {label tuple: value}
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._cycle_started = None
+        self._cycle_stages = {}
+        self._cycle_counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as one run of a stage; failures are counted as stage errors"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.count('stage_errors', stage=name)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms.setdefault(('stage_seconds', (('stage', stage),)), _Histogram()).observe(seconds)
+            if self._cycle_started is not None:
+                self._cycle_stages[stage] = self._cycle_stages.get(stage, 0.0) + seconds
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if self._cycle_started is not None:
+                self._cycle_counters[key] = self._cycle_counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def take(self):
+        """Remove and return the stage histograms and counters recorded so far, for merge() in another process"""
+        with self._lock:
+            recorded = {'histograms': self.histograms, 'counters': self.counters}
+            self.histograms = {}
+            self.counters = {}
+        return recorded
+
+    def merge(self, recorded):
+        """Add what take() returned in another process, counting it towards the current cycle"""
+        with self._lock:
+            for key, histogram in recorded['histograms'].items():
+                self.histograms.setdefault(key, _Histogram()).merge(histogram)
+                name, labels = key
+                if name == 'stage_seconds' and self._cycle_started is not None:
+                    stage = dict(labels)['stage']
+                    self._cycle_stages[stage] = self._cycle_stages.get(stage, 0.0) + histogram.sum
+            for key, value in recorded['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+                if self._cycle_started is not None:
+                    self._cycle_counters[key] = self._cycle_counters.get(key, 0) + value
+
+    def begin_cycle(self):
+        with self._lock:
+            self._cycle_started = time.time()
+            self._cycle_stages = {}
+            self._cycle_counters = {}
+
+    def end_cycle(self):
+        """Summary of the cycle since begin_cycle(): seconds per stage, counter increases and gauges"""
+        with self._lock:
+            started = self._cycle_started or time.time()
+            summary = {
+                'started': round(started, 3),
+                'seconds': round(time.time() - started, 3),
+                'stages': {stage: round(seconds, 4) for stage, seconds in sorted(self._cycle_stages.items())},
+                'counters': {name + _labels(dict(labels)): value
+                             for (name, labels), value in sorted(self._cycle_counters.items())},
+                'gauges': {name + _labels(dict(labels)): value
+                           for (name, labels), value in sorted(self.gauges.items())},
+            }
+            self._cycle_started = None
+        return summary
+
+    def render(self):
+        """The registry in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        bucket_labels = _labels(dict(labels, le=bound))
+                        lines.append(f"{PREFIX}{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{_labels(dict(labels))} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{_labels(dict(labels))} {histogram.count}")
+            for kind, values, suffix in (('counter', self.counters, '_total'), ('gauge', self.gauges, '')):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {PREFIX}{name}{suffix} {kind}")
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(f"{PREFIX}{name}{suffix}{_labels(dict(labels))} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve /metrics from a daemon thread"""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
+
+
+def write_cycle_summary(summary, path):
+    """Log a cycle summary and append it to a JSON-lines file"""
+    line = json.dumps(summary, sort_keys=True)
+    logger.info(f"Cycle metrics: {line}")
+    if path:
+        try:
+            with open(path, 'a') as f:
+                f.write(line + '\n')
+        except Exception as e:
+            logger.error(f"Error writing cycle metrics: {e}")
+
+
+METRICS = Metrics()
@@ -0,0 +1,454 @@
+import logging
+import os
+import time
+
+from digest import MAX_DIGEST_BYTES, MAX_DIGEST_LISTINGS, build_digest_messages, change_listings
+from history_store import HistoryStore
+from listing_parser import parse_search_page
+from metrics import METRICS, write_cycle_summary
+from notifier import EmailNotifier
+from profiler import PROFILE_DIR, CycleProfiler
+from rate_limiter import RateLimiter
+from scheduler import SearchScheduler
+from search_fetcher import SearchFetcher, load_searches
+from seen_store import SeenListingsStore
+from snapshot_store import SnapshotStore
+from tile_planner import TilePlanner
+from work_queue import WorkQueue
+from worker_pool import SearchWorkerPool
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+
+class MonitorFlow:
+    """Base class of the monitors: configuration, state, diff, notify, persistence and the run loops.
+
+    __init__ wires up everything the monitors share from the environment,
+    with `parse` turning a fetched search page into (listings, cursors).
+    Subclasses provide get_all_listings(searches) and may extend
+    summaries(), after_cycle(), finish_cycle() and close().
+    """
+
+    # Email subjects get subject_suffix; the digests start with these headings
+    subject_suffix = ''
+    new_heading = "New Airbnb Listings Found!"
+    change_heading = "Airbnb Listing Updates"
+
+    def __init__(self, parse=parse_search_page):
+        # Email configuration - these will be set as environment variables
+        self.smtp_server = "smtp.gmail.com"
+        self.smtp_port = 587
+        self.sender_email = os.getenv('SENDER_EMAIL')
+        self.sender_password = os.getenv('SENDER_PASSWORD')  # App password for Gmail
+        self.recipient_email = os.getenv('RECIPIENT_EMAIL')
+        self.notifier = EmailNotifier(self.smtp_server, self.smtp_port, self.sender_email, self.sender_password)
+
+        # Large batches are split into several digest emails so Gmail does not clip them
+        self.digest_max_bytes = int(os.getenv('DIGEST_MAX_BYTES', str(MAX_DIGEST_BYTES)))
+        self.digest_max_listings = int(os.getenv('DIGEST_MAX_LISTINGS', str(MAX_DIGEST_LISTINGS)))
+
+        # Append-only log of previously seen listings (migrated from seen_listings.json),
+        # forgotten after SEEN_TTL_DAYS without being seen or when over SEEN_MAX_ENTRIES
+        self.data_file = 'seen_listings.log'
+        self.store = SeenListingsStore(self.data_file,
+                                       ttl_days=float(os.getenv('SEEN_TTL_DAYS', '180')),
+                                       max_entries=int(os.getenv('SEEN_MAX_ENTRIES', '1000000')))
+
+        # Your Airbnb searches (searches.json, or the single AIRBNB_SEARCH_URL)
+        self.searches = load_searches()
+        self.search_url = self.searches[0]['url'] if self.searches else None
+
+        # Load previously seen listings
+        self.seen_listings = self.load_seen_listings()
+
+        # Last known name and price of every listing, to report price drops, renames and relistings
+        self.snapshots = SnapshotStore(relist_after_days=float(os.getenv('RELIST_AFTER_DAYS', '7'))).load()
+        self.notify_changes = set(os.getenv('NOTIFY_CHANGES', 'price_dropped,title_changed,relisted').split(','))
+
+        # Columnar history of every observation, for price and lifetime queries (see history_store.py)
+        self.history = HistoryStore()
+
+        # Stage timings and counters: METRICS_PORT serves /metrics, every cycle is appended to METRICS_FILE
+        self.metrics_file = os.getenv('METRICS_FILE', 'cycle_metrics.jsonl')
+        if os.getenv('METRICS_PORT'):
+            METRICS.serve(int(os.getenv('METRICS_PORT')))
+
+        # SIGUSR1 or a profile.request file profiles the next PROFILE_CYCLES cycles into PROFILE_DIR (see profiler.py)
+        self.profiler = CycleProfiler(os.getenv('PROFILE_DIR', PROFILE_DIR), int(os.getenv('PROFILE_CYCLES', '3')))
+
+        # WORK_QUEUE=/shared/path/queue.db shares the searches and the seen state between nodes (run_distributed)
+        queue_path = os.getenv('WORK_QUEUE')
+        self.queue = WorkQueue(queue_path,
+                               lease_seconds=int(os.getenv('WORK_QUEUE_LEASE_SECONDS', '600')),
+                               relist_after_days=float(os.getenv('RELIST_AFTER_DAYS', '7')),
+                               ttl_days=float(os.getenv('SEEN_TTL_DAYS', '180')),
+                               max_entries=int(os.getenv('SEEN_MAX_ENTRIES', '1000000'))) if queue_path else None
+        self.queue_batch = int(os.getenv('WORK_QUEUE_BATCH', '8'))
+
+        # One request budget for every search and every monitor process on this machine,
+        # slowed down automatically on 429s and captcha pages (see rate_limiter.py)
+        self.limiter = RateLimiter(rate=float(os.getenv('RATE_LIMIT_PER_MINUTE', '30')) / 60,
+                                   burst=int(os.getenv('RATE_LIMIT_BURST', '4')),
+                                   max_rate=float(os.getenv('RATE_LIMIT_MAX_PER_MINUTE', '120')) / 60)
+
+        # Concurrency limits for fetching several searches at once
+        self.max_concurrent_fetches = int(os.getenv('MAX_CONCURRENT_FETCHES', '8'))
+        self.max_fetches_per_host = int(os.getenv('MAX_FETCHES_PER_HOST', '4'))
+
+        # Result pages read per search (pages 2+ are fetched concurrently) and their page cursors
+        self.max_result_pages = int(os.getenv('MAX_RESULT_PAGES', '5'))
+        self.page_fan_out = int(os.getenv('PAGE_FAN_OUT', '4'))
+        self.page_cursors = {}
+        self.fetch_errors = {}
+
+        # Each search is polled on its own adaptive interval, backing off on 429/5xx/captcha
+        self.scheduler = SearchScheduler(interval_minutes=float(os.getenv('POLL_INTERVAL_MINUTES', '30')),
+                                         min_minutes=float(os.getenv('POLL_MIN_MINUTES', '5')),
+                                         max_minutes=float(os.getenv('POLL_MAX_MINUTES', '240')))
+        self.scheduler.sync(self.searches)
+
+        # MAP_SHARDING=1 splits map searches (URLs with ne_lat/sw_lng...) into tiles under the page cap
+        self.tiles = TilePlanner(max_pages=self.max_result_pages) if os.getenv('MAP_SHARDING') == '1' else None
+
+        # One aiohttp session kept open across polls for every result page (ETag revalidation, br when available)
+        self.search_fetcher = SearchFetcher(HEADERS,
+                                            max_concurrency=self.max_concurrent_fetches,
+                                            per_host_limit=self.max_fetches_per_host,
+                                            max_pages=self.max_result_pages,
+                                            fan_out=self.page_fan_out,
+                                            parse=parse,
+                                            limiter=self.limiter)
+
+        # FETCH_WORKERS=N fetches and parses the searches in N processes; diffing and email stay here
+        fetch_workers = int(os.getenv('FETCH_WORKERS', '0'))
+        self.workers = SearchWorkerPool(fetch_workers, HEADERS,
+                                        parse=parse,
+                                        limiter=self.limiter,
+                                        max_concurrency=self.max_concurrent_fetches,
+                                        per_host_limit=self.max_fetches_per_host,
+                                        max_pages=self.max_result_pages,
+                                        fan_out=self.page_fan_out) if fetch_workers else None
+        # Whichever of the above served the last HTTP fetch, for its traffic summary
+        self.http_client = self.workers or self.search_fetcher
+
+    def load_seen_listings(self):
+        """Load previously seen listings from file"""
+        try:
+            return self.store.load()
+        except Exception as e:
+            logger.error(f"Error loading seen listings: {e}")
+            return self.store.recover()
+
+    def save_snapshots(self, changed):
+        """Persist the snapshots of listings that are new or changed"""
+        try:
+            with METRICS.stage('persist'):
+                self.snapshots.append(changed)
+        except Exception as e:
+            logger.error(f"Error saving listing snapshots: {e}")
+
+    def record_history(self, results):
+        """Append this cycle's observations to the history store in one batch"""
+        try:
+            with METRICS.stage('persist'):
+                self.history.append_cycle([(search, listings) for search, listings in results if search and listings])
+        except Exception as e:
+            logger.error(f"Error recording listing history: {e}")
+
+    def save_seen_listings(self, records):
+        """Append new and refreshed (id, last_seen) records to the store"""
+        try:
+            with METRICS.stage('persist'):
+                self.store.append(records)
+                if self.store.needs_compaction(self.seen_listings):
+                    self.seen_listings = self.store.compact(self.seen_listings)
+                    # Forget the snapshots of listings the seen set has just dropped by TTL or size cap
+                    self.snapshots.prune(self.seen_listings.last_seen_many)
+        except Exception as e:
+            logger.error(f"Error saving seen listings: {e}")
+
+    def fetch_http(self, searches):
+        """Fetch the searches' result pages without a browser and parse their embedded state"""
+        self.http_client = self.workers or self.search_fetcher
+        if self.workers:
+            return self.workers.fetch(searches, cursor_cache=self.page_cursors, planner=self.tiles,
+                                      errors=self.fetch_errors)
+        return self.search_fetcher.fetch(searches,
+                                         is_seen=lambda listing_id: listing_id in self.seen_listings,
+                                         cursor_cache=self.page_cursors,
+                                         planner=self.tiles,
+                                         errors=self.fetch_errors)
+
+    def digest_footer(self):
+        """Footer of the notification digests, if any"""
+        return None
+
+    def send_notification(self, new_listings, search_name=None):
+        """Send email notification for new listings"""
+        if not new_listings:
+            return
+
+        try:
+            subject = f"🏠 {len(new_listings)} New Airbnb Listing(s) Found!{self.subject_suffix}"
+            if search_name:
+                subject += f" - {search_name}"
+
+            messages = build_digest_messages(new_listings, self.sender_email, self.recipient_email,
+                                             subject, self.new_heading,
+                                             footer=self.digest_footer(),
+                                             max_bytes=self.digest_max_bytes,
+                                             max_listings=self.digest_max_listings)
+
+            # Hand off to the background sender so the poll loop carries on right away
+            for msg, count in messages:
+                self.notifier.submit(msg, f"{count} new listings")
+
+        except Exception as e:
+            logger.error(f"Error sending email: {e}")
+
+    def send_change_notification(self, events, search_name=None):
+        """Send email notification for price drops, renames and relistings of known listings"""
+        try:
+            subject = f"🔔 {len(events)} Airbnb Listing Update(s){self.subject_suffix}"
+            if search_name:
+                subject += f" - {search_name}"
+
+            messages = build_digest_messages(change_listings(events), self.sender_email, self.recipient_email,
+                                             subject, self.change_heading,
+                                             footer=self.digest_footer(),
+                                             max_bytes=self.digest_max_bytes,
+                                             max_listings=self.digest_max_listings,
+                                             intro=f"{len(events)} known listing(s) changed")
+
+            for msg, count in messages:
+                self.notifier.submit(msg, f"{count} listing updates")
+
+        except Exception as e:
+            logger.error(f"Error sending email: {e}")
+
+    def check_for_new_listings(self, searches=None):
+        """Check the given searches (default: all) for new listings and reschedule them"""
+        logger.info("Checking for new listings...")
+        searches = searches or self.searches
+        METRICS.begin_cycle()
+        self.profiler.begin_cycle()
+        self.fetch_errors.clear()
+        with METRICS.stage('fetch'):
+            results = self.get_all_listings(searches)
+
+        records = []
+        for search, current_listings in results:
+            error = self.fetch_errors.get(search.get('id') or search['url']) or self.fetch_errors.get(search['url'])
+            if not current_listings:
+                METRICS.count('empty_results')
+                logger.warning(f"No listings found for '{search['name']}' - this might indicate an issue")
+                self.scheduler.record(search, error=error or 'empty')
+                continue
+            search_records, activity = self.process_listings(current_listings,
+                                                             search['name'] if len(self.searches) > 1 else None)
+            records.extend(search_records)
+            # Listings came back, so errors on later pages or a cheaper tier do not count as a failed poll
+            self.scheduler.record(search, new_listings=activity)
+
+        # Persist only this cycle's new and refreshed IDs in one batch, then evict a slice of stale ones
+        self.save_seen_listings(records)
+        self.seen_listings.evict_step()
+        self.record_history(results)
+        self.finish_cycle()
+
+    def finish_cycle(self):
+        """Record the gauges and write this cycle's metrics summary"""
+        METRICS.gauge('seen_set_size', len(self.seen_listings))
+        write_cycle_summary(METRICS.end_cycle(), self.metrics_file)
+        self.profiler.end_cycle()
+
+    def close(self):
+        """Close the email sender, the fetch session and workers, and the work queue"""
+        self.notifier.close()
+        self.search_fetcher.close()
+        if self.workers:
+            self.workers.close()
+        if self.queue:
+            self.queue.close()
+
+    def process_listings(self, current_listings, search_name=None):
+        """Diff one search's listings against the seen set and notify.
+
+        Returns the records to persist and the number of new and changed listings.
+        """
+        with METRICS.stage('diff'):
+            new_listings = []
+            current_ids = set()
+
+            for listing in current_listings:
+                listing_id = listing['id']
+                current_ids.add(listing_id)
+
+                if listing_id not in self.seen_listings:
+                    new_listings.append(listing)
+                    logger.info(f"New listing found: {listing['name']} (ID: {listing_id})")
+
+            # Compare names and prices with the last snapshots before touch() moves the last-seen times
+            events, changed = self.snapshots.diff(current_listings, self.seen_listings.last_seen_many)
+        self.save_snapshots(changed)
+        activity = len(new_listings) + len(events)
+        METRICS.count('listings', len(current_listings))
+        METRICS.count('new_listings', len(new_listings))
+        METRICS.count('changed_listings', len(events))
+
+        records = self.seen_listings.touch(current_ids)
+        self.notify(new_listings, events, search_name)
+
+        return records, activity
+
+    def notify(self, new_listings, events, search_name=None):
+        """Email the new listings and the change events the user asked for"""
+        if new_listings:
+            self.send_notification(new_listings, search_name)
+            logger.info(f"Found {len(new_listings)} new listings")
+        else:
+            logger.info("No new listings found")
+
+        events = [event for event in events if event['kind'] in self.notify_changes]
+        if events:
+            self.send_change_notification(events, search_name)
+            logger.info(f"Found {len(events)} changed listings")
+
+    def join_queue(self):
+        """Register this node's searches with the work queue and seed it with the listings known here"""
+        logger.info(f"Joining work queue {self.queue.path} as {self.queue.owner}")
+        self.queue.sync(self.searches, self.scheduler.new_entry)
+        # Listings this node already reported are not new to the queue either
+        ids = list(self.seen_listings)
+        snapshots = self.snapshots.snapshots
+        self.queue.seed((listing_id, *snapshots.get(listing_id, (None, None, None))[1:], seen_at)
+                        for listing_id, seen_at in zip(ids, self.seen_listings.last_seen_many(ids)))
+
+    def check_leased_searches(self):
+        """Lease due searches from the shared work queue, fetch them, and commit the results.
+
+        The queue decides which listings are new or changed, so every node emails
+        about a listing at most once. Returns False when no search was due.
+        """
+        leases = self.queue.lease(self.queue_batch)
+        if not leases:
+            return False
+        logger.info(f"Leased {len(leases)} search(es) from the work queue")
+        METRICS.begin_cycle()
+        self.profiler.begin_cycle()
+        self.fetch_errors.clear()
+        with METRICS.stage('fetch'):
+            results = self.get_all_listings([lease['search'] for lease in leases])
+
+        records = []
+        for lease, (search, current_listings) in zip(leases, results):
+            error = self.fetch_errors.get(lease['key'])
+            if not current_listings:
+                METRICS.count('empty_results')
+                logger.warning(f"No listings found for '{search['name']}' - this might indicate an issue")
+                self.queue.release(lease, lambda schedule, _: self.scheduler.advance(schedule, search,
+                                                                                     error=error or 'empty'))
+                continue
+            with METRICS.stage('commit'):
+                committed = self.queue.commit(lease, current_listings,
+                                              lambda schedule, activity: self.scheduler.advance(schedule, search,
+                                                                                                activity))
+            if committed is None:
+                logger.warning(f"Lease on '{search['name']}' ran out before the commit - dropping its results")
+                continue
+            new_listings, events = committed
+            METRICS.count('listings', len(current_listings))
+            METRICS.count('new_listings', len(new_listings))
+            METRICS.count('changed_listings', len(events))
+            for listing in new_listings:
+                logger.info(f"New listing found: {listing['name']} (ID: {listing['id']})")
+            records.extend(self.seen_listings.touch({listing['id'] for listing in current_listings}))
+            self.notify(new_listings, events, search['name'] if len(self.searches) > 1 else None)
+
+        self.save_seen_listings(records)
+        self.seen_listings.evict_step()
+        self.queue.evict()
+        self.record_history(results)
+        self.finish_cycle()
+        return True
+
+    def summaries(self):
+        """One-line summaries of the fetch machinery, logged after each cycle"""
+        return [self.http_client.summary(), self.limiter.summary()]
+
+    def after_cycle(self):
+        """Called after each cycle that fetched something"""
+        for summary in self.summaries():
+            logger.info(summary)
+
+    def run_once(self):
+        """Run the monitor once"""
+        try:
+            self.check_for_new_listings()
+        except Exception as e:
+            logger.error(f"Error in monitoring: {e}")
+        finally:
+            self.close()
+
+    def run_continuous(self):
+        """Run the monitor continuously, polling each search when the scheduler says it is due"""
+        logger.info(f"Starting continuous monitoring of {len(self.searches)} search(es)")
+
+        try:
+            while True:
+                try:
+                    due = self.scheduler.due()
+                    if due:
+                        self.check_for_new_listings(due)
+                        self.after_cycle()
+                        logger.info(self.scheduler.summary())
+                    wait = self.scheduler.wait_time()
+                    logger.info(f"Sleeping for {wait / 60:.1f} minutes...")
+                    time.sleep(wait)
+                except KeyboardInterrupt:
+                    logger.info("Monitoring stopped by user")
+                    break
+                except Exception as e:
+                    logger.error(f"Error in monitoring loop: {e}")
+                    # Searches popped for the failed check are still due and get polled again
+                    self.scheduler.sync(self.searches)
+                    time.sleep(300)  # Wait 5 minutes before retrying
+        finally:
+            self.close()
+
+    def run_distributed(self, once=False):
+        """Run as one of several nodes sharing WORK_QUEUE: lease due searches, fetch, commit, repeat.
+
+        With once=True (one-shot runs, such as GitHub Actions) it returns as
+        soon as no search is due.
+        """
+        self.join_queue()
+        try:
+            while True:
+                try:
+                    if self.check_leased_searches():
+                        logger.info(self.queue.summary())
+                        self.after_cycle()
+                        continue
+                    if once:
+                        break
+                    # Wake up at least every minute for jobs other nodes add
+                    time.sleep(min(60, self.queue.wait_time()))
+                except KeyboardInterrupt:
+                    logger.info("Monitoring stopped by user")
+                    break
+                except Exception as e:
+                    logger.error(f"Error in monitoring loop: {e}")
+                    if once:
+                        break
+                    time.sleep(60)
+        finally:
+            self.close()
@@ -0,0 +1,108 @@
+import logging
+import queue
+import smtplib
+import threading
+
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+class EmailNotifier:
+    """Sends notification emails from a background thread over one reused SMTP connection.
+
+    submit() only enqueues the message, so the polling loop never waits on
+    the mail server. The worker logs in once and keeps the connection open
+    while messages keep coming. It quits after `idle_timeout` seconds of
+    silence, before the server drops it. A connection that went away anyway
+    is reopened and the message retried once.
+    """
+
+    def __init__(self, smtp_server, smtp_port, sender_email, sender_password, idle_timeout=60):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.idle_timeout = idle_timeout
+
+        self.queue = queue.Queue()
+        self.handshakes = 0
+        self.sent = 0
+        self._server = None
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, msg, description=''):
+        """Queue a message for sending and return immediately"""
+        self._ensure_worker()
+        self.queue.put((msg, description))
+
+    def flush(self):
+        """Block until every queued message has been handled"""
+        self.queue.join()
+
+    def close(self):
+        """Send what is queued, stop the worker and close the connection"""
+        if self._worker and self._worker.is_alive():
+            self.queue.put(None)
+            self._worker.join()
+        self._worker = None
+        self._disconnect()
+
+    def send(self, msg):
+        """Send one message synchronously over the pooled connection"""
+        for attempt in range(2):
+            try:
+                with METRICS.stage('smtp'):
+                    self._connection().send_message(msg)
+                self.sent += 1
+                METRICS.count('emails_sent')
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError):
+                # Stale or dropped connection: reconnect and retry once
+                self._disconnect()
+                if attempt:
+                    raise
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='email-notifier', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+
+            try:
+                if item is None:
+                    return
+                msg, description = item
+                self.send(msg)
+                logger.info(f"Email notification sent{' for ' + description if description else ''}")
+            except Exception as e:
+                logger.error(f"Error sending email: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _connection(self):
+        if self._server is None:
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+            server.starttls()
+            server.login(self.sender_email, self.sender_password)
+            self._server = server
+            self.handshakes += 1
+        return self._server
+
+    def _disconnect(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            pass
+        self._server = None
@@ -0,0 +1,97 @@
+import logging
+import time
+from collections import defaultdict, deque
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+logger = logging.getLogger(__name__)
+
+CARD_SELECTOR = "[data-testid='card-container']"
+
+# Resolves as soon as listing cards are on the page and their count has not
+# changed for `quietMs`. It is driven by a MutationObserver, with a short
+# interval as backstop for changes that do not touch the DOM tree. A
+# StaysSearch API response that has finished loading means the results are
+# final, so the quiet window is shortened then. Gives up after `deadlineMs`.
+WAIT_FOR_CARDS_JS = r"""
+const quietMs = arguments[0];
+const deadlineMs = arguments[1];
+const selector = arguments[2];
+const done = arguments[arguments.length - 1];
+
+const started = performance.now();
+let lastCount = -1;
+let lastChange = started;
+let finished = false;
+let observer = null;
+let timer = null;
+
+function searchResponseArrived() {
+    return performance.getEntriesByType('resource').some(entry => entry.name.includes('StaysSearch'));
+}
+
+function finish(reason) {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    if (observer) {
+        observer.disconnect();
+    }
+    clearInterval(timer);
+    done({reason: reason, cards: Math.max(lastCount, 0), elapsed: (performance.now() - started) / 1000});
+}
+
+function check() {
+    const now = performance.now();
+    const count = document.querySelectorAll(selector).length;
+    if (count !== lastCount) {
+        lastCount = count;
+        lastChange = now;
+    }
+    const quietFor = now - lastChange;
+    if (count > 0 && (quietFor >= quietMs || (quietFor >= quietMs / 4 && searchResponseArrived()))) {
+        finish('ready');
+    } else if (now - started >= deadlineMs) {
+        finish('deadline');
+    }
+}
+
+observer = new MutationObserver(check);
+observer.observe(document.documentElement, {childList: true, subtree: true});
+timer = setInterval(check, 100);
+check();
+"""
+
+
+class ReadinessTracker:
+    """Waits for search pages to finish rendering and keeps recent time-to-ready per search"""
+
+    def __init__(self, deadline=30, quiescence=0.75, history=50):
+        self.deadline = deadline
+        self.quiescence = quiescence
+        self.times = defaultdict(lambda: deque(maxlen=history))
+
+    def wait(self, driver, search_key):
+        """Block until the page's listing cards settle or the deadline passes; returns True if ready"""
+        started = time.monotonic()
+        reason, cards = 'deadline', 0
+        try:
+            driver.set_script_timeout(self.deadline + 5)
+            result = driver.execute_async_script(WAIT_FOR_CARDS_JS, int(self.quiescence * 1000),
+                                                 int(self.deadline * 1000), CARD_SELECTOR)
+            reason, cards = result['reason'], result['cards']
+        except (TimeoutException, WebDriverException) as e:
+            logger.warning(f"Readiness check failed: {e}")
+
+        elapsed = time.monotonic() - started
+        self.times[search_key].append(elapsed)
+        if reason == 'ready':
+            logger.info(f"Page ready in {elapsed:.2f}s ({cards} cards, average {self.average(search_key):.2f}s)")
+        else:
+            logger.warning(f"Timeout waiting for listings to load after {elapsed:.2f}s")
+        return reason == 'ready'
+
+    def average(self, search_key):
+        times = self.times[search_key]
+        return sum(times) / len(times) if times else 0.0
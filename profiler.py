@@ -0,0 +1,230 @@
+"""Profile the next few monitor cycles on request, without restarting the monitor.
+
+Send the process SIGUSR1, or create the control file (profile.request,
+optionally containing a number of cycles):
+
+    kill -USR1 <pid>
+    echo 5 > profile.request
+
+The next cycle that starts is profiled, along with the cycles after it
+(PROFILE_CYCLES, default 3). Profiling is paused between those cycles,
+so the sleeps in between are not part of it. When they are done, one
+directory under PROFILE_DIR receives:
+
+    profile.pstats      cProfile stats of the main thread (pstats, snakeviz)
+    profile.txt         the top functions by cumulative and own time
+    stacks.collapsed    sampled stacks of every thread, for flamegraph.pl or speedscope
+    allocations.txt     tracemalloc, per cycle: what the cycle allocated and kept, by line,
+                        plus the largest tracebacks of the last cycle
+
+Nothing runs while no profile is requested. The only cost is a check for
+the control file once per cycle. Searches fetched in FETCH_WORKERS
+processes are not profiled.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = 'profiles'
+CONTROL_FILE = 'profile.request'
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    """Counts the stacks of every other thread at a fixed interval into `stacks`, in collapsed-stack form.
+
+    cProfile records only caller -> callee pairs and only for the thread that
+    enabled it, so the flamegraph stacks are sampled instead. One sampler
+    runs per profiled cycle; they all add to the same dict.
+    """
+
+    def __init__(self, interval, stacks):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = stacks
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        names = {}
+        while not self._done.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class CycleProfiler:
+    """Runs cProfile, a stack sampler and tracemalloc for `cycles` monitor cycles when asked to.
+
+    The monitors call begin_cycle() when a cycle starts and end_cycle() when
+    it finishes. Everything is switched on in begin_cycle() and off again in
+    end_cycle(). A cycle that fails before end_cycle() stays profiled into
+    the next one, and the capture simply covers one more cycle.
+
+    tracemalloc cannot be paused without dropping its traces, so it is
+    started and stopped with every cycle. The report therefore shows, per
+    cycle, what that cycle allocated and still held at its end.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, cycles=3, control_path=CONTROL_FILE, sample_interval=0.005,
+                 trace_frames=10, top=30):
+        self.directory = directory
+        self.cycles = cycles
+        self.control_path = control_path
+        self.sample_interval = sample_interval
+        self.trace_frames = trace_frames
+        self.top = top
+        self.requested = 0
+        self.remaining = 0
+        self._profile = None
+        self._running = False
+        self._install_signal()
+
+    def request(self, cycles=None):
+        """Profile the next `cycles` cycles (default: the configured number)"""
+        self.requested = cycles or self.cycles
+
+    def begin_cycle(self):
+        if self._running:
+            return
+        if self._profile is None:
+            self._check_control_file()
+            if not self.requested:
+                return
+            self._start()
+        self._resume()
+
+    def end_cycle(self):
+        if not self._running:
+            return
+        self._pause()
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self._finish()
+
+    def _install_signal(self):
+        # Signal handlers can only be set from the main thread, and SIGUSR1 does not exist on Windows
+        if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.request())
+
+    def _check_control_file(self):
+        if not self.control_path or not os.path.exists(self.control_path):
+            return
+        try:
+            with open(self.control_path, 'r') as f:
+                content = f.read().strip()
+            os.remove(self.control_path)
+            self.request(int(content) if content else None)
+        except Exception as e:
+            logger.error(f"Error reading profile request {self.control_path}: {e}")
+
+    def _start(self):
+        self.remaining = self.requested
+        self.requested = 0
+        logger.info(f"Profiling the next {self.remaining} cycle(s)")
+        self._started = time.time()
+        self._profile = cProfile.Profile()
+        self._stacks = {}
+        self._samples = 0
+        self._seconds = 0.0
+        self._allocations = []
+        self._snapshot = None
+
+    def _resume(self):
+        self._running = True
+        self._resumed = time.perf_counter()
+        self._stop_tracing = not tracemalloc.is_tracing()
+        if self._stop_tracing:
+            tracemalloc.start(self.trace_frames)
+        else:
+            tracemalloc.reset_peak()
+        self._baseline = tracemalloc.take_snapshot()
+        self._sampler = _StackSampler(self.sample_interval, self._stacks)
+        self._sampler.start()
+        self._profile.enable()
+
+    def _pause(self):
+        self._profile.disable()
+        self._sampler.stop()
+        self._samples += self._sampler.samples
+        snapshot = tracemalloc.take_snapshot()
+        memory = tracemalloc.get_traced_memory()
+        if self._stop_tracing:
+            tracemalloc.stop()
+        seconds = time.perf_counter() - self._resumed
+        self._seconds += seconds
+
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                  tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                  tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>')]
+        snapshot = snapshot.filter_traces(ignore)
+        lines = [f"Cycle {len(self._allocations) + 1}: {seconds:.1f}s, traced memory "
+                 f"{memory[0] / 1024:.0f} KiB at the end, {memory[1] / 1024:.0f} KiB at peak",
+                 f"Allocated during the cycle and still held at its end, by line (top {self.top}):"]
+        lines += [str(stat) for stat in snapshot.compare_to(self._baseline.filter_traces(ignore), 'lineno')[:self.top]
+                  if stat.size_diff > 0]
+        self._allocations.append('\n'.join(lines))
+        self._snapshot = snapshot
+        self._baseline = self._sampler = None
+        self._running = False
+
+    def _finish(self):
+        try:
+            path = self._write()
+            logger.info(f"Profile of {self._seconds:.1f}s over {len(self._allocations)} cycle(s) written to {path}")
+        except Exception as e:
+            logger.error(f"Error writing profile: {e}")
+        finally:
+            self._profile = self._stacks = self._allocations = self._snapshot = None
+
+    def _write(self):
+        path = os.path.join(self.directory, time.strftime('%Y%m%d-%H%M%S', time.localtime(self._started)))
+        os.makedirs(path, exist_ok=True)
+
+        self._profile.dump_stats(os.path.join(path, 'profile.pstats'))
+        report = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=report).strip_dirs()
+        stats.sort_stats('cumulative').print_stats(self.top)
+        stats.sort_stats('tottime').print_stats(self.top)
+        with open(os.path.join(path, 'profile.txt'), 'w') as f:
+            f.write(report.getvalue())
+
+        with open(os.path.join(path, 'stacks.collapsed'), 'w') as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        with open(os.path.join(path, 'allocations.txt'), 'w') as f:
+            f.write(f"{self._samples} stack samples over {self._seconds:.1f}s of profiled cycles\n")
+            for cycle in self._allocations:
+                f.write(f"\n{cycle}\n")
+            f.write("\nLargest allocation tracebacks still held at the end of the last cycle:\n")
+            for stat in self._snapshot.statistics('traceback')[:5]:
+                f.write(f"\n{stat}\n")
+                f.write('\n'.join(stat.traceback.format()) + '\n')
+        return path
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the bucket is only shared between threads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_FILE = 'rate_limit.state'
+
+# tokens, last refill time, current rate (requests/s), time of the last penalty, configured rate
+STATE = struct.Struct('<ddddd')
+
+
+class RateLimiter:
+    """Token bucket for every request to airbnb.com, shared by threads and processes.
+
+    The bucket lives in a small file that is locked with flock on every
+    update, so all monitor processes on the machine draw from one budget.
+    Tokens refill at the current rate, up to `burst`.
+
+    The rate adapts additively up and multiplicatively down. A 429 or a
+    captcha page halves it (`decrease`), never below `min_rate`, and empties
+    the bucket. After `cooldown` seconds without a penalty, each successful
+    request raises it by `increase`, up to `max_rate`. The learned rate is
+    kept in the file across runs, together with the configured `rate`. When
+    that changes, the file starts over from the new configuration, and the
+    learned rate is held to [min_rate, max_rate] on every read.
+    """
+
+    def __init__(self, path=RATE_LIMIT_FILE, rate=0.5, burst=4, min_rate=0.02, max_rate=2.0, increase=0.01,
+                 decrease=0.5, cooldown=300):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.waited = 0.0
+        self.penalties = 0
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def try_acquire(self):
+        """Take a token if one is available; returns 0, or the seconds until one will be"""
+        def take(state, now):
+            if state[0] >= 1:
+                state[0] -= 1
+                return 0.0
+            return (1 - state[0]) / state[2]
+        return self._update(take)
+
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            self.waited += delay
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait for a token without blocking the event loop"""
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            self.waited += delay
+            await asyncio.sleep(delay)
+
+    def reward(self):
+        """Record a successful request, raising the rate once the last penalty is old enough"""
+        def increase(state, now):
+            if now - state[3] >= self.cooldown:
+                state[2] = min(self.max_rate, state[2] + self.increase)
+        self._update(increase)
+
+    def penalize(self, reason):
+        """Record a 429 or captcha page: cut the rate and empty the bucket"""
+        def decrease(state, now):
+            state[0] = 0.0
+            # Requests that were already in flight when the first penalty came count once
+            if now - state[3] >= self.burst / state[2]:
+                state[2] = max(self.min_rate, state[2] * self.decrease)
+                state[3] = now
+            return state[2]
+        rate = self._update(decrease)
+        self.penalties += 1
+        logger.warning(f"Rate limited ({reason}): slowing down to {rate * 60:.1f} requests/min")
+
+    def current_rate(self):
+        return self._update(lambda state, now: state[2])
+
+    def summary(self):
+        return (f"Rate limit: {self.current_rate() * 60:.1f} requests/min, {self.waited:.0f}s waited, "
+                f"{self.penalties} penalties")
+
+    def close(self):
+        os.close(self._fd)
+
+    def __getstate__(self):
+        """Pickle the settings only; a worker process opens the shared file itself"""
+        state = dict(self.__dict__, waited=0.0, penalties=0)
+        del state['_lock'], state['_fd']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _update(self, change):
+        """Refill the shared bucket and apply change(state, now) to it under the file lock"""
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                data = os.read(self._fd, STATE.size)
+                state = list(STATE.unpack(data)) if len(data) == STATE.size else None
+                if state is None or state[4] != self.rate:
+                    # A missing file, an older format or another configuration
+                    state = [float(self.burst), now, self.rate, 0.0, self.rate]
+                state[2] = min(self.max_rate, max(self.min_rate, state[2]))
+                state[0] = min(self.burst, state[0] + max(0.0, now - state[1]) * state[2])
+                state[1] = now
+                result = change(state, now)
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, STATE.pack(*state))
+                return result
+            finally:
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from selenium.common.exceptions import WebDriverException
+
+logger = logging.getLogger(__name__)
+
+BLOCKING_FILE = 'resource_blocking.json'
+
+# URL patterns (Network.setBlockedURLs wildcards) for each resource type we
+# can skip. Listing cards only need the DOM and the image URLs as strings.
+RESOURCE_PATTERNS = {
+    'image': ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico', '*muscache.com/im/*'],
+    'font': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot'],
+    'media': ['*.mp4', '*.webm', '*.m3u8', '*.mp3', '*.m4s'],
+    'tracking': [
+        '*google-analytics.com/*', '*googletagmanager.com/*', '*doubleclick.net/*', '*googleadservices.com/*',
+        '*connect.facebook.net/*', '*facebook.com/tr*', '*bat.bing.com/*', '*analytics.tiktok.com/*',
+        '*ct.pinterest.com/*', '*hotjar.com/*', '*sentry.io/*', '*browser-intake-datadoghq.com/*',
+    ],
+}
+DEFAULT_BLOCKED = ('image', 'font', 'media', 'tracking')
+
+# Rough per-request sizes, used to estimate savings for a resource type
+# until a response of that type has actually been measured
+TYPICAL_RESPONSE_BYTES = {'Image': 30_000, 'Font': 40_000, 'Media': 500_000, 'Script': 25_000, 'Other': 5_000}
+
+# Images never requested because the image preference is off: they keep
+# their src but have no pixels
+UNLOADED_IMAGES_JS = r"""
+const sources = new Set();
+for (const img of document.images) {
+    if (img.currentSrc || img.src) {
+        if (!img.naturalWidth) {
+            sources.add(img.currentSrc || img.src);
+        }
+    }
+}
+return sources.size;
+"""
+
+
+class ResourceBlocker:
+    """Keeps headless Chrome from downloading what the monitors never look at.
+
+    Which resource types are blocked comes from resource_blocking.json, if
+    present, for example {"image": {"block": true, "allow": ["*logo*"]},
+    "script": {"block": true, "deny": ["*some-widget.com/*"]}}. Anything not
+    listed keeps the defaults. BLOCK_RESOURCES=none turns blocking off. A
+    comma list such as BLOCK_RESOURCES=font,media picks the types instead.
+
+    Blocking has two layers. When images are blocked with no allow patterns,
+    the Chrome image preference stops them in the renderer. Every other
+    pattern goes to Network.setBlockedURLs in each tab. That command cannot
+    make exceptions, so an allow entry removes the matching deny pattern
+    and also keeps the image preference off for its type.
+
+    Network events from Chrome's performance log give the requests and bytes
+    each page load actually used, and the blocked requests by type. Bytes
+    saved are estimated from the average size of loaded responses of the
+    same type. Pooled browsers report from their own threads, so the running
+    totals and the events waiting for their tab are guarded by a lock, and
+    the events are kept per browser session.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = {name: {'block': name in DEFAULT_BLOCKED, 'deny': list(patterns), 'allow': []}
+                      for name, patterns in RESOURCE_PATTERNS.items()}
+        for name, rule in (rules or {}).items():
+            merged = self.rules.setdefault(name, {'block': True, 'deny': [], 'allow': []})
+            merged['block'] = rule.get('block', merged['block'])
+            merged['deny'] = merged['deny'] + list(rule.get('deny', []))
+            merged['allow'] = merged['allow'] + list(rule.get('allow', []))
+
+        # Running totals across page loads, used for estimates and the summary
+        self.loaded_bytes = Counter()
+        self.loaded_requests = Counter()
+        self.blocked_requests = Counter()
+        self.saved_bytes = 0
+        self.page_loads = 0
+        # (session id, tab) -> network events not reported yet
+        self._pending = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=BLOCKING_FILE):
+        """Build a blocker from resource_blocking.json and BLOCK_RESOURCES"""
+        rules = {}
+        try:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    rules = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading resource blocking rules from {path}: {e}")
+
+        selected = os.getenv('BLOCK_RESOURCES')
+        if selected is not None:
+            types = {name.strip() for name in selected.split(',') if name.strip() and name.strip() != 'none'}
+            for name in set(RESOURCE_PATTERNS) | set(rules) | types:
+                rules.setdefault(name, {})['block'] = name in types
+        return cls(rules)
+
+    def blocked_patterns(self):
+        patterns = []
+        for rule in self.rules.values():
+            if rule['block']:
+                patterns.extend(pattern for pattern in rule['deny']
+                                if pattern not in rule['allow'] and pattern not in patterns)
+        return patterns
+
+    @property
+    def images_disabled(self):
+        rule = self.rules.get('image')
+        return bool(rule and rule['block'] and not rule['allow'])
+
+    def apply_options(self, chrome_options):
+        """Set the Chrome preferences and the performance log capability before the browser starts"""
+        if self.images_disabled:
+            chrome_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+    def prepare_tab(self, driver):
+        """Install the URL block list in the current tab (CDP settings are per tab)"""
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_patterns()})
+        except WebDriverException as e:
+            logger.warning(f"Could not install resource blocking: {e}")
+
+    def report(self, driver):
+        """Log and return requests, bytes and savings for the page in the current tab"""
+        self._drain(driver)
+        session = driver.session_id
+        handle = driver.current_window_handle
+        with self._lock:
+            events = self._pending.pop((session, handle), None)
+            if events is None:
+                # Older chromedrivers prefix window handles; with one tab there is no doubt
+                keys = [key for key in self._pending
+                        if key[0] == session and (handle.endswith(key[1]) or key[1].endswith(handle))]
+                events = self._pending.pop(keys[0], []) if len(keys) == 1 else []
+
+        types = {}
+        loaded_bytes = Counter()
+        loaded_requests = Counter()
+        blocked = Counter()
+        for method, params in events:
+            if method == 'Network.requestWillBeSent':
+                types[params['requestId']] = params.get('type', 'Other')
+            elif method == 'Network.loadingFinished':
+                resource_type = types.get(params['requestId'], 'Other')
+                loaded_bytes[resource_type] += int(params.get('encodedDataLength', 0))
+                loaded_requests[resource_type] += 1
+            elif method == 'Network.loadingFailed' and params.get('blockedReason'):
+                blocked[types.get(params['requestId'], params.get('type', 'Other'))] += 1
+
+        if self.images_disabled:
+            try:
+                blocked['Image'] = max(blocked['Image'], driver.execute_script(UNLOADED_IMAGES_JS))
+            except WebDriverException:
+                pass
+
+        with self._lock:
+            self.loaded_bytes.update(loaded_bytes)
+            self.loaded_requests.update(loaded_requests)
+            saved_bytes = sum(count * self._average_bytes(resource_type) for resource_type, count in blocked.items())
+            self.blocked_requests.update(blocked)
+            self.saved_bytes += saved_bytes
+            self.page_loads += 1
+
+        stats = {
+            'requests': sum(loaded_requests.values()),
+            'bytes': sum(loaded_bytes.values()),
+            'blocked_requests': sum(blocked.values()),
+            'blocked_by_type': dict(blocked),
+            'saved_bytes': saved_bytes,
+        }
+        logger.info(f"Page load used {stats['requests']} requests ({stats['bytes'] / 1024:.0f} KB); "
+                    f"blocked {stats['blocked_requests']} requests (~{saved_bytes / 1024:.0f} KB saved)")
+        return stats
+
+    def forget(self, session_id):
+        """Drop the events still waiting for the tabs of a browser session.
+
+        The pool calls this once every tab of a batch has been read, and when
+        the browser quits, so events of tabs that timed out or were never
+        reported do not pile up.
+        """
+        with self._lock:
+            for key in [key for key in self._pending if key[0] == session_id]:
+                del self._pending[key]
+
+    def summary(self):
+        with self._lock:
+            return (f"Resource blocking: {sum(self.blocked_requests.values())} requests blocked "
+                    f"(~{self.saved_bytes / 1024 / 1024:.1f} MB saved) over {self.page_loads} page loads")
+
+    def _average_bytes(self, resource_type):
+        if self.loaded_requests[resource_type]:
+            return self.loaded_bytes[resource_type] // self.loaded_requests[resource_type]
+        return TYPICAL_RESPONSE_BYTES.get(resource_type, TYPICAL_RESPONSE_BYTES['Other'])
+
+    def _drain(self, driver):
+        """Sort the performance log by tab; other tabs' events wait for their own report"""
+        try:
+            entries = driver.get_log('performance')
+        except WebDriverException as e:
+            logger.debug(f"Performance log unavailable: {e}")
+            return
+        events = []
+        for entry in entries:
+            message = json.loads(entry['message'])
+            method = message['message'].get('method', '')
+            if method in ('Network.requestWillBeSent', 'Network.loadingFinished', 'Network.loadingFailed'):
+                events.append((message.get('webview', ''), method, message['message']['params']))
+        with self._lock:
+            for handle, method, params in events:
+                self._pending[(driver.session_id, handle)].append((method, params))
@@ -0,0 +1,139 @@
+import heapq
+import json
+import logging
+import os
+import random
+import time
+
+from tiered_fetch import search_key
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_FILE = 'schedule.json'
+
+
+class SearchScheduler:
+    """Decides when each search is polled next, using a heap keyed by next-due time.
+
+    Every search has its own interval. It starts at the search's
+    "interval_minutes" or the default, and stays between `min_minutes` and
+    `max_minutes`. A poll that finds new listings shortens the interval by
+    `speedup`, and a quiet poll lengthens it by `slowdown`, so requests go to
+    the searches where listings actually appear.
+
+    Failed polls (HTTP 429 or 5xx, a captcha, an empty page) back off
+    exponentially from the interval, up to `max_backoff_minutes`, until a
+    poll succeeds again. Every delay gets +/- `jitter` of random spread, so
+    searches do not hit the site in lockstep.
+
+    Next-due times and intervals are saved in schedule.json, so one-shot
+    runs (cron, GitHub Actions) only poll the searches that are due.
+    """
+
+    def __init__(self, interval_minutes=30, min_minutes=5, max_minutes=240, jitter=0.15, max_backoff_minutes=360,
+                 speedup=0.7, slowdown=1.15, state_path=SCHEDULE_FILE):
+        self.default_interval = interval_minutes * 60
+        self.min_interval = min_minutes * 60
+        self.max_interval = max_minutes * 60
+        self.jitter = jitter
+        self.max_backoff = max_backoff_minutes * 60
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.state_path = state_path
+        self.state = self._load()
+        self.searches = {}
+        self.heap = []
+
+    def sync(self, searches, now=None):
+        """Schedule the configured searches; searches seen for the first time are due right away"""
+        now = now if now is not None else time.time()
+        self.searches = {search_key(search): search for search in searches}
+        for key in list(self.state):
+            if key not in self.searches:
+                del self.state[key]
+        self.heap = []
+        for key, search in self.searches.items():
+            entry = self.state.setdefault(key, self.new_entry(search, now))
+            heapq.heappush(self.heap, (entry['next_due'], key))
+
+    def new_entry(self, search, now=None):
+        """Schedule state of a search that has not been polled yet: due right away"""
+        return {
+            'interval': self._clamp(search.get('interval_minutes', self.default_interval / 60) * 60),
+            'next_due': now if now is not None else time.time(),
+            'failures': 0,
+        }
+
+    def due(self, now=None):
+        """Pop and return every search whose time has come"""
+        now = now if now is not None else time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            next_due, key = heapq.heappop(self.heap)
+            # Entries rescheduled since they were pushed are stale
+            if key in self.state and self.state[key]['next_due'] == next_due:
+                due.append(self.searches[key])
+        return due
+
+    def wait_time(self, now=None):
+        """Seconds until the next search is due"""
+        now = now if now is not None else time.time()
+        return max(0.0, self.heap[0][0] - now) if self.heap else self.default_interval
+
+    def record(self, search, new_listings=0, error=None, now=None):
+        """Reschedule a search after a poll.
+
+        error is only given for a poll that got no listings at all: an HTTP
+        status, 'captcha', 'empty' or another failure. Any listings count as
+        a success, even if some pages or tiers failed.
+        """
+        key = search_key(search)
+        entry = self.state[key]
+        self.advance(entry, search, new_listings, error, now)
+        heapq.heappush(self.heap, (entry['next_due'], key))
+        self._save()
+
+    def advance(self, entry, search, new_listings=0, error=None, now=None):
+        """Update a schedule entry in place after a poll (also used for the shared work queue's entries)"""
+        now = now if now is not None else time.time()
+        if error is not None:
+            entry['failures'] += 1
+            delay = min(self.max_backoff, entry['interval'] * 2 ** entry['failures'])
+            logger.warning(f"Backing off '{search['name']}' for {delay / 60:.0f} min after {error} "
+                           f"(failure {entry['failures']})")
+        else:
+            entry['failures'] = 0
+            factor = self.speedup if new_listings else self.slowdown
+            entry['interval'] = self._clamp(entry['interval'] * factor)
+            delay = entry['interval']
+        entry['next_due'] = now + delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+        return entry
+
+    def summary(self):
+        now = time.time()
+        parts = [f"{self.searches[key]['name']} every {entry['interval'] / 60:.0f} min, "
+                 f"next in {max(0, entry['next_due'] - now) / 60:.0f} min"
+                 for key, entry in sorted(self.state.items(), key=lambda item: item[1]['next_due'])
+                 if key in self.searches]
+        return "Schedule: " + '; '.join(parts)
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def _load(self):
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading schedule from {self.state_path}: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving schedule: {e}")
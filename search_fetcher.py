@@ -0,0 +1,361 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import aiohttp
+
+from http_session import traffic_summary
+from listing_parser import parse_search_page
+from metrics import METRICS
+from tile_planner import tile_url
+
+logger = logging.getLogger(__name__)
+
+# Same shape as the 'airbnb_searches' list the dashboard (index.html) keeps in
+# localStorage: [{"id": ..., "name": ..., "url": ..., "enabled": true}, ...]
+SEARCHES_FILE = 'searches.json'
+
+
+def load_searches(path=SEARCHES_FILE):
+    """Load the enabled searches, falling back to the single AIRBNB_SEARCH_URL"""
+    searches = []
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                searches = [search for search in json.load(f)
+                            if search.get('url') and search.get('enabled', True) is not False]
+    except Exception as e:
+        logger.error(f"Error loading searches from {path}: {e}")
+
+    if not searches and os.getenv('AIRBNB_SEARCH_URL'):
+        searches = [{'id': 'default', 'name': 'Default search', 'url': os.getenv('AIRBNB_SEARCH_URL')}]
+
+    return searches
+
+
+class ValidatorCache:
+    """Least recently used map of page URL -> (etag, last_modified, parsed page), holding at most max_entries"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def put(self, url, etag, last_modified, page):
+        self._entries[url] = (etag, last_modified, page)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, url):
+        self._entries.pop(url, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+async def _fetch_one(session, search, timeout, errors=None, limiter=None, cached=None, stats=None):
+    """Fetch one search page; returns (html or None when not modified, (etag, last_modified)), or None on failure.
+
+    When errors is a dict, the HTTP status (or 'failed') of a failed fetch is
+    stored under the search's key. With a RateLimiter, the request waits for
+    a token first and a 429 slows the limiter down. cached is the (etag,
+    last_modified) of the page's last full response, which makes the
+    request conditional. stats, when given, counts the requests, 304s and
+    bytes on the wire and decoded.
+    """
+    headers = {}
+    if cached:
+        etag, last_modified = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    if limiter is not None:
+        await limiter.acquire_async()
+    started = time.monotonic()
+    try:
+        async with session.get(search['url'], headers=headers,
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            METRICS.count('http_requests', status=response.status)
+            if stats is not None:
+                stats['requests'] += 1
+            if response.status == 429 and limiter is not None:
+                limiter.penalize(f"429 for '{search['name']}'")
+            if response.status == 304 and cached:
+                METRICS.count('not_modified')
+                if stats is not None:
+                    stats['not_modified'] += 1
+                logger.info(f"'{search['name']}' not modified since last poll")
+                if limiter is not None:
+                    limiter.reward()
+                return None, cached
+            response.raise_for_status()
+            body = await response.read()
+            html_content = await response.text()
+            # Content-Length is the size before decompression; chunked responses only have the decoded size
+            on_wire = response.content_length or len(body)
+            METRICS.count('http_bytes', on_wire)
+            if stats is not None:
+                stats['bytes_on_wire'] += on_wire
+                stats['bytes_decoded'] += len(body)
+            logger.info(f"Fetched '{search['name']}' in {time.monotonic() - started:.2f}s ({len(html_content)} chars)")
+            if limiter is not None:
+                limiter.reward()
+            return html_content, (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error fetching '{search['name']}': {e}")
+        reason = getattr(e, 'status', None) or ('timeout' if isinstance(e, asyncio.TimeoutError) else 'failed')
+        METRICS.count('fetch_errors', reason=reason)
+        if errors is not None:
+            errors[search.get('id') or search['url']] = reason if reason != 'timeout' else 'failed'
+        return None
+
+
+def page_url(url, cursor):
+    """The search URL for the results page a pagination cursor points at"""
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key not in ('cursor', 'pagination_search', 'items_offset', 'section_offset')]
+    query += [('pagination_search', 'true'), ('cursor', cursor)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def _fetch_search_pages(session, search, timeout, parse, max_pages, fan_out, is_seen, cursor_cache, errors=None,
+                              limiter=None, validators=None, stats=None):
+    """Fetch up to max_pages result pages of one search; returns its unique listings or None.
+
+    Later pages are fetched concurrently, at most fan_out at a time. Their
+    cursors come from the first page. The cursors remembered from the last
+    poll are requested at the same time as the first page, so in the steady
+    state every page arrives after about one page's latency.
+
+    Searches marked "newest_first" are read in waves of fan_out pages
+    instead, and stop after the first page whose listings have all been
+    seen before.
+
+    Only a search that yields no listings records an error. A failed later
+    page (or a stale prefetched cursor) is logged and counted as a partial
+    fetch, so the scheduler does not back off a poll that mostly worked.
+
+    validators, a ValidatorCache, keeps the validators and the parsed
+    listings and cursors of every page that sent an ETag or Last-Modified,
+    so a page answered with 304 is neither downloaded nor parsed again.
+    """
+    key = search.get('id') or search['url']
+    semaphore = asyncio.Semaphore(fan_out)
+    page_errors = {}
+
+    async def fetch_page(number, url):
+        async with semaphore:
+            page = dict(search, id=number, url=url,
+                        name=f"{search['name']} (page {number})" if number > 1 else search['name'])
+            cached = validators.get(url) if validators is not None else None
+            fetched = await _fetch_one(session, page, timeout, page_errors, limiter, cached and cached[:2], stats)
+        if fetched is None:
+            return None
+        html_content, validator = fetched
+        if html_content is None:
+            listings, cursors = cached[2]
+            return list(listings), list(cursors)
+        with METRICS.stage('parse'):
+            listings, cursors = parse(html_content)
+        if number == 1 and not listings and 'captcha' in html_content.lower():
+            logger.warning(f"'{search['name']}' returned a captcha page")
+            METRICS.count('fetch_errors', reason='captcha')
+            page_errors[1] = 'captcha'
+            if limiter is not None:
+                limiter.penalize(f"captcha for '{search['name']}'")
+        if validators is not None:
+            if listings and any(validator):
+                validators.put(url, *validator, (listings, cursors))
+            else:
+                validators.pop(url)
+        return listings, cursors
+
+    def all_seen(listings):
+        return is_seen is not None and bool(listings) and all(is_seen(listing['id']) for listing in listings)
+
+    newest_first = bool(search.get('newest_first'))
+    prefetch = {}
+    if not newest_first:
+        for number, cursor in enumerate(cursor_cache.get(key, [])[1:max_pages], 2):
+            prefetch[cursor] = asyncio.create_task(fetch_page(number, page_url(search['url'], cursor)))
+
+    first = await fetch_page(1, search['url'])
+    if first is None or not first[0]:
+        for task in prefetch.values():
+            task.cancel()
+        if errors is not None and 1 in page_errors:
+            errors[key] = page_errors[1]
+        return first[0] if first else None
+    listings, cursors = first
+    cursor_cache[key] = cursors
+
+    pages = [listings]
+    later = cursors[1:max_pages]
+    if newest_first:
+        stop = all_seen(listings)
+        for start in range(0, len(later), fan_out):
+            if stop:
+                break
+            wave = later[start:start + fan_out]
+            results = await asyncio.gather(*(fetch_page(start + offset + 2, page_url(search['url'], cursor))
+                                             for offset, cursor in enumerate(wave)))
+            for page_listings, _ in (result or ([], []) for result in results):
+                pages.append(page_listings)
+                if all_seen(page_listings):
+                    stop = True
+                    break
+    else:
+        tasks = [prefetch.pop(cursor, None) or asyncio.create_task(fetch_page(number, page_url(search['url'], cursor)))
+                 for number, cursor in enumerate(later, 2)]
+        for task in prefetch.values():
+            # Cursors that no longer exist on this poll
+            task.cancel()
+        pages += [result[0] if result else [] for result in await asyncio.gather(*tasks)]
+
+    unique_listings = []
+    seen_ids = set()
+    for page_listings in pages:
+        for listing in page_listings:
+            if listing['id'] not in seen_ids:
+                seen_ids.add(listing['id'])
+                unique_listings.append(listing)
+    if len(pages) > 1:
+        logger.info(f"Read {len(pages)} result pages for '{search['name']}' ({len(unique_listings)} unique listings)")
+    if page_errors:
+        METRICS.count('partial_fetches')
+        logger.warning(f"{len(page_errors)} later result page(s) of '{search['name']}' failed; keeping the rest")
+    return unique_listings
+
+
+async def _fetch_tiled(session, search, timeout, parse, max_pages, fan_out, is_seen, cursor_cache, planner,
+                       errors=None, limiter=None, validators=None, stats=None):
+    """Fetch a map search tile by tile, splitting tiles that hit the page cap; returns unique listings or None"""
+    key = search.get('id') or search['url']
+    pending = planner.tiles(search)
+    unique_listings = []
+    seen_ids = set()
+    fetched = failed = 0
+    tile_errors = {}
+    while pending:
+        tiles = [dict(search, id=f"{key}@{','.join(map(str, box))}", url=tile_url(search['url'], box),
+                      name=f"{search['name']} tile {fetched + number}")
+                 for number, box in enumerate(pending, 1)]
+        results = await asyncio.gather(*(_fetch_search_pages(session, tile, timeout, parse, max_pages, fan_out,
+                                                             is_seen, cursor_cache, tile_errors, limiter,
+                                                             validators, stats)
+                                         for tile in tiles))
+        fetched += len(tiles)
+        split = []
+        for box, tile, listings in zip(pending, tiles, results):
+            if listings is None:
+                failed += 1
+                continue
+            for listing in listings:
+                if listing['id'] not in seen_ids:
+                    seen_ids.add(listing['id'])
+                    unique_listings.append(listing)
+            split += planner.observe(search, box, len(cursor_cache.get(tile['id']) or [None]))
+        pending = split
+
+    planner.rebalance(search)
+    # Forget the cursors of tiles that were split or merged away
+    current = {f"{key}@{','.join(map(str, box))}" for box in planner.tiles(search)}
+    for tile_key in [tile_key for tile_key in cursor_cache
+                     if tile_key.startswith(f"{key}@") and tile_key not in current]:
+        del cursor_cache[tile_key]
+    logger.info(f"Read {fetched} map tiles for '{search['name']}' ({len(unique_listings)} unique listings)")
+    if failed < fetched:
+        return unique_listings
+    if errors is not None:
+        errors[key] = next(iter(tile_errors.values()), 'failed')
+    return None
+
+
+class SearchFetcher:
+    """Fetches and parses every page of every search over one aiohttp session kept open between polls.
+
+    The session lives on the fetcher's own event loop, so connections stay
+    alive from one cycle to the next instead of being set up again for every
+    poll. Pages are revalidated with ETag/If-Modified-Since, and aiohttp
+    advertises the encodings it can decode: gzip and deflate, plus br when
+    the Brotli package is installed (the caller's Accept-Encoding header is
+    dropped for that reason).
+
+    stats counts the requests, the new connections (each a TCP and TLS
+    handshake), the 304s, and the bytes on the wire and after decoding, as
+    summary() reports them. parse(html) returns (listings, page cursors).
+    Every request goes through the RateLimiter, when one is given. Call
+    close() when done.
+    """
+
+    def __init__(self, headers, max_concurrency=8, per_host_limit=4, timeout=30, max_pages=1, fan_out=4,
+                 parse=parse_search_page, limiter=None, cache_entries=512):
+        self.headers = {key: value for key, value in headers.items() if key.lower() != 'accept-encoding'}
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.fan_out = fan_out
+        self.parse = parse
+        self.limiter = limiter
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+        # url -> (etag, last_modified, (listings, cursors)) of the last full response, bounded
+        self.validators = ValidatorCache(cache_entries)
+        self.stats = {'requests': 0, 'handshakes': 0, 'not_modified': 0, 'bytes_on_wire': 0, 'bytes_decoded': 0}
+
+    def fetch(self, searches, is_seen=None, cursor_cache=None, planner=None, errors=None):
+        """Return [(search, listings or None)] in order.
+
+        is_seen(listing_id) drives the early stop of "newest_first" searches.
+        cursor_cache is a dict kept by the caller between polls. With a
+        TilePlanner, map searches that have a bounding box are fetched as
+        tiles. errors collects, per search key, the HTTP status or 'captcha'
+        of searches that returned nothing.
+        """
+        started = time.monotonic()
+        results = self.loop.run_until_complete(self._fetch(searches, is_seen, cursor_cache, planner, errors))
+        logger.info(f"Fetched {len(searches)} searches in {time.monotonic() - started:.2f}s")
+        return results
+
+    async def _fetch(self, searches, is_seen, cursor_cache, planner, errors):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.per_host_limit)
+            tracing = aiohttp.TraceConfig()
+            tracing.on_connection_create_end.append(self._connection_created)
+            self.session = aiohttp.ClientSession(connector=connector, headers=self.headers, trace_configs=[tracing])
+        cursor_cache = cursor_cache if cursor_cache is not None else {}
+        results = await asyncio.gather(*(
+            _fetch_tiled(self.session, search, self.timeout, self.parse, self.max_pages, self.fan_out, is_seen,
+                         cursor_cache, planner, errors, self.limiter, self.validators, self.stats)
+            if planner is not None and planner.applies(search) else
+            _fetch_search_pages(self.session, search, self.timeout, self.parse, self.max_pages, self.fan_out,
+                                is_seen, cursor_cache, errors, self.limiter, self.validators, self.stats)
+            for search in searches))
+        return list(zip(searches, results))
+
+    async def _connection_created(self, session, context, params):
+        self.stats['handshakes'] += 1
+
+    def summary(self):
+        """One-line description of the traffic so far"""
+        return traffic_summary(self.stats)
+
+    def close(self):
+        if self.session is not None:
+            self.loop.run_until_complete(self.session.close())
+            self.session = None
+        self.loop.close()
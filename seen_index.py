@@ -0,0 +1,320 @@
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+# File layout (little endian):
+#   header     MAGIC(8) | count u64 | bloom_bits u64 | hashes u32 | reserved u32
+#   bloom      bloom_bits / 8 bytes, padded to a multiple of 8
+#   ids        count x u64, sorted ascending
+#   last_seen  count x u32 epoch seconds, aligned with ids, padded to a multiple of 8
+MAGIC = b'SEENIDX2'
+# Version 1 had no last_seen section; its entries count as seen when the file was written
+MAGIC_V1 = b'SEENIDX1'
+HEADER = struct.Struct('<8sQQII')
+BITS_PER_ID = 10
+HASHES = 7
+
+UINT64_MAX = 0xFFFFFFFFFFFFFFFF
+
+
+def _splitmix64(values):
+    """Vectorized splitmix64 finalizer over a uint64 array (wraps modulo 2**64)"""
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _bloom_positions(ids, bloom_bits, hashes):
+    """Bit positions for each ID, shape (len(ids), hashes), via double hashing"""
+    with np.errstate(over='ignore'):
+        h1 = _splitmix64(ids)
+        h2 = _splitmix64(ids ^ np.uint64(0x5BD1E9955BD1E995)) | np.uint64(1)
+        steps = np.arange(hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(bloom_bits)
+
+
+def is_indexable(listing_id):
+    return listing_id.isdigit() and int(listing_id) <= UINT64_MAX
+
+
+def to_id_arrays(records):
+    """Split {id: last_seen} into (sorted uint64 ids, aligned uint32 last_seen, {id: last_seen} not indexable)"""
+    numeric = {}
+    other = {}
+    for listing_id, last_seen in records.items():
+        if is_indexable(listing_id):
+            numeric[int(listing_id)] = last_seen
+        else:
+            other[listing_id] = last_seen
+    ids = np.fromiter(numeric.keys(), dtype=np.uint64, count=len(numeric))
+    last_seen = np.fromiter(numeric.values(), dtype=np.uint32, count=len(numeric))
+    order = np.argsort(ids)
+    return ids[order], last_seen[order], other
+
+
+class SeenIndex:
+    """Read-only, memory-mapped set of listing IDs stored as sorted 64-bit integers.
+
+    Membership is answered by a Bloom filter first (most IDs on a search page
+    are either long known or brand new, and the filter settles the new ones
+    without touching the ID array), then by binary search. The file is mapped
+    read-only, so any number of processes can open it and share the same
+    page-cache pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.bloom_bits, self.hashes, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic not in (MAGIC, MAGIC_V1):
+            self._mmap.close()
+            raise ValueError(f"{path} is not a seen-listings index")
+        self.outdated = magic != MAGIC
+        bloom_bytes = _padded(self.bloom_bits // 8)
+        ids_offset = HEADER.size + bloom_bytes
+        self._bloom = np.frombuffer(self._mmap, dtype=np.uint8, count=bloom_bytes, offset=HEADER.size)
+        self.ids = np.frombuffer(self._mmap, dtype=np.uint64, count=self.count, offset=ids_offset)
+        if self.outdated:
+            self.last_seen = np.full(self.count, int(os.path.getmtime(path)), dtype=np.uint32)
+        else:
+            self.last_seen = np.frombuffer(self._mmap, dtype=np.uint32, count=self.count, offset=ids_offset + 8 * self.count)
+
+    @classmethod
+    def build(cls, path, ids, last_seen):
+        """Write an index for sorted unique uint64 IDs and their last-seen times atomically, and open it"""
+        ids = np.asarray(ids, dtype=np.uint64)
+        last_seen = np.asarray(last_seen, dtype=np.uint32)
+        bloom_bits = max(64, _padded(len(ids) * BITS_PER_ID // 8) * 8)
+        bits = np.zeros(bloom_bits, dtype=bool)
+        if len(ids):
+            bits[_bloom_positions(ids, bloom_bits, HASHES).ravel().astype(np.int64)] = True
+        bloom = np.packbits(bits, bitorder='little')
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(ids), bloom_bits, HASHES, 0))
+            f.write(bloom.tobytes())
+            f.write(ids.tobytes())
+            f.write(last_seen.tobytes())
+            f.write(b'\0' * (_padded(4 * len(ids)) - 4 * len(ids)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, listing_id):
+        return self.locate_many([listing_id])[0] >= 0
+
+    def locate_array(self, values):
+        """Vectorized lookup for a uint64 array: position of each value in self.ids, or -1"""
+        slots = np.full(len(values), -1, dtype=np.int64)
+        if not self.count or not len(values):
+            return slots
+        positions = _bloom_positions(values, self.bloom_bits, self.hashes).astype(np.int64)
+        maybe = np.all((self._bloom[positions >> 3] >> (positions & 7).astype(np.uint8)) & 1, axis=1)
+        candidates = values[maybe]
+        found = np.minimum(np.searchsorted(self.ids, candidates), self.count - 1)
+        slots[maybe] = np.where(self.ids[found] == candidates, found, -1)
+        return slots
+
+    def locate_many(self, ids):
+        """Positions for a list of string IDs (-1 when absent; non-numeric IDs are never indexed)"""
+        numeric = [is_indexable(listing_id) for listing_id in ids]
+        values = np.array([int(listing_id) for listing_id, ok in zip(ids, numeric) if ok], dtype=np.uint64)
+        slots = iter(self.locate_array(values).tolist())
+        return [next(slots) if ok else -1 for ok in numeric]
+
+    def contains_many(self, ids):
+        return [slot >= 0 for slot in self.locate_many(ids)]
+
+    def close(self):
+        # Drop the numpy views first; a mmap with live exported buffers cannot be closed
+        self._bloom = self.ids = self.last_seen = None
+        self._mmap.close()
+
+
+class SeenIdSet:
+    """Set-like view of seen IDs with last-seen times and bounded size.
+
+    Wraps a SeenIndex plus small in-memory overlays: `added` for IDs not in the
+    index, `touched` for newer last-seen times of indexed IDs, and `evicted`
+    for indexed IDs dropped by TTL or the size cap. An evicted ID that shows up
+    again is treated as new. Eviction runs incrementally: each evict_step()
+    scans at most `evict_budget` index entries, continuing where the previous
+    step stopped.
+    """
+
+    def __init__(self, index, added=None, ttl_seconds=None, max_entries=None, evict_budget=50000, touch_resolution=86400):
+        self.index = index
+        self.added = {}
+        self.touched = {}
+        self.evicted = set()
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.evict_budget = evict_budget
+        # Last-seen times closer than this to the stored one are not rewritten, so
+        # re-seeing known listings costs no I/O on most cycles
+        self.touch_resolution = touch_resolution
+        self._cursor = 0
+        self._lru_cutoff = 0
+        if added:
+            for (listing_id, last_seen), slot in zip(added.items(), self.index.locate_many(list(added))):
+                # A log replayed after an interrupted compaction may hold older times than the index
+                if slot < 0 or last_seen > self.index.last_seen[slot]:
+                    self._record(listing_id, last_seen, slot)
+
+    def __contains__(self, listing_id):
+        if listing_id in self.added or listing_id in self.touched:
+            return True
+        if listing_id in self.evicted:
+            return False
+        return listing_id in self.index
+
+    def __len__(self):
+        return len(self.index) - len(self.evicted) + len(self.added)
+
+    def __iter__(self):
+        for value in self.index.ids:
+            listing_id = str(value)
+            if listing_id not in self.evicted:
+                yield listing_id
+        yield from self.added
+
+    def last_seen(self, listing_id):
+        if listing_id in self.added:
+            return self.added[listing_id]
+        if listing_id in self.touched:
+            return self.touched[listing_id]
+        if listing_id in self.evicted:
+            return None
+        slot = self.index.locate_many([listing_id])[0]
+        return int(self.index.last_seen[slot]) if slot >= 0 else None
+
+    def last_seen_many(self, ids):
+        """Last-seen times for a batch of IDs (None where unknown), with one index lookup"""
+        ids = list(ids)
+        times = []
+        for listing_id, slot in zip(ids, self.index.locate_many(ids)):
+            if listing_id in self.added:
+                times.append(self.added[listing_id])
+            elif listing_id in self.touched:
+                times.append(self.touched[listing_id])
+            elif slot >= 0 and listing_id not in self.evicted:
+                times.append(int(self.index.last_seen[slot]))
+            else:
+                times.append(None)
+        return times
+
+    def add(self, listing_id):
+        self.update([listing_id])
+
+    def update(self, ids):
+        self.touch(ids)
+
+    def touch(self, ids, now=None):
+        """Mark IDs as seen at `now`; returns the (id, timestamp) records that need persisting"""
+        now = int(now if now is not None else time.time())
+        ids = list(dict.fromkeys(ids))
+        records = []
+        for listing_id, slot in zip(ids, self.index.locate_many(ids)):
+            previous = self.added.get(listing_id, self.touched.get(listing_id))
+            if previous is None and slot >= 0 and listing_id not in self.evicted:
+                previous = int(self.index.last_seen[slot])
+            if previous is not None and now - previous < self.touch_resolution:
+                continue
+            self._record(listing_id, now, slot)
+            records.append((listing_id, now))
+        return records
+
+    def _record(self, listing_id, last_seen, slot):
+        if slot >= 0:
+            self.touched[listing_id] = last_seen
+            self.evicted.discard(listing_id)
+        else:
+            self.added[listing_id] = last_seen
+
+    def evict_step(self, now=None):
+        """Evict a bounded slice of expired or least-recently-seen entries; returns how many were dropped"""
+        if not self.ttl_seconds and not self.max_entries:
+            return 0
+        now = int(now if now is not None else time.time())
+        cutoff = now - self.ttl_seconds if self.ttl_seconds else 0
+
+        if self.max_entries and len(self) > self.max_entries:
+            if not self._lru_cutoff:
+                # Everything no newer than the first entry past the cap goes; ties may
+                # take the set slightly under the cap, never over it. Kept until the
+                # sweep brings the set back under the cap.
+                self._lru_cutoff = self._newest_beyond(self.max_entries) + 1
+        else:
+            self._lru_cutoff = 0
+        cutoff = max(cutoff, self._lru_cutoff)
+        if not cutoff:
+            return 0
+
+        dropped = 0
+        count = len(self.index)
+        if count:
+            start = self._cursor
+            stop = min(start + self.evict_budget, count)
+            expired = np.nonzero(self.index.last_seen[start:stop] < cutoff)[0] + start
+            for value in self.index.ids[expired].tolist():
+                listing_id = str(value)
+                if listing_id in self.evicted:
+                    continue
+                if self.touched.get(listing_id, 0) >= cutoff:
+                    continue
+                self.touched.pop(listing_id, None)
+                self.evicted.add(listing_id)
+                dropped += 1
+            self._cursor = stop if stop < count else 0
+
+        for listing_id in [listing_id for listing_id, last_seen in self.added.items() if last_seen < cutoff]:
+            del self.added[listing_id]
+            dropped += 1
+        return dropped
+
+    def _newest_beyond(self, k):
+        """Last-seen time of the (k+1)-th most recently seen live entry"""
+        times = np.array(self.index.last_seen)
+        live = np.ones(len(times), dtype=bool)
+        if self.touched:
+            slots = np.array(self.index.locate_many(list(self.touched)), dtype=np.int64)
+            times[slots] = np.fromiter(self.touched.values(), dtype=np.uint32, count=len(self.touched))
+        if self.evicted:
+            slots = np.array(self.index.locate_many(list(self.evicted)), dtype=np.int64)
+            live[slots[slots >= 0]] = False
+        times = np.concatenate([times[live], np.fromiter(self.added.values(), dtype=np.uint32, count=len(self.added))])
+        if k >= len(times):
+            return 0
+        return int(np.partition(times, len(times) - k - 1)[len(times) - k - 1])
+
+    def merged_records(self):
+        """Everything live as (sorted uint64 ids, aligned uint32 last_seen, {id: last_seen} not indexable)"""
+        ids = np.array(self.index.ids)
+        last_seen = np.array(self.index.last_seen)
+        keep = np.ones(len(ids), dtype=bool)
+        if self.evicted:
+            slots = np.array(self.index.locate_many(list(self.evicted)), dtype=np.int64)
+            keep[slots[slots >= 0]] = False
+        if self.touched:
+            slots = np.array(self.index.locate_many(list(self.touched)), dtype=np.int64)
+            last_seen[slots] = np.fromiter(self.touched.values(), dtype=np.uint32, count=len(self.touched))
+
+        added_ids, added_last_seen, other = to_id_arrays(self.added)
+        ids = np.concatenate([ids[keep], added_ids])
+        last_seen = np.concatenate([last_seen[keep], added_last_seen])
+        order = np.argsort(ids, kind='stable')
+        return ids[order], last_seen[order], other
+
+
+def _padded(nbytes):
+    return (nbytes + 7) // 8 * 8
@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import time
+
+from seen_index import SeenIdSet, SeenIndex, to_id_arrays
+
+logger = logging.getLogger(__name__)
+
+
+class SeenListingsStore:
+    """Append-only, crash-safe log of seen listing IDs, backed by a compact index.
+
+    The log holds one 'id last_seen' record per line. A check appends only the
+    IDs it has not seen before, plus known IDs whose last-seen time moved by
+    more than the touch resolution, in one write followed by one fsync (group
+    commit). Its I/O cost therefore follows what changed, not the whole
+    history. A crash can at worst leave a torn last line, which is dropped on
+    the next load.
+
+    Compaction folds the log into a memory-mapped SeenIndex next to it and
+    truncates the log, leaving out entries evicted by TTL or the size cap.
+    Both files are replaced with an atomic rename, index first. If a crash
+    lands between the two renames, the old log is replayed on the next load
+    and the IDs already in the index are dropped.
+    """
+
+    def __init__(self, path='seen_listings.log', legacy_path='seen_listings.json', compact_min_records=1000,
+                 ttl_days=None, max_entries=None):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.legacy_path = legacy_path
+        self.compact_min_records = compact_min_records
+        self.ttl_seconds = int(ttl_days * 86400) if ttl_days else None
+        self.max_entries = max_entries or None
+        # Lines currently in the log, including duplicates, used to decide when to compact
+        self.records = 0
+
+    def load(self):
+        """Return a SeenIdSet of seen IDs, repairing a torn tail and migrating the legacy JSON file"""
+        logged = self._read_log()
+
+        if not os.path.exists(self.index_path):
+            if not logged and self.legacy_path and os.path.exists(self.legacy_path):
+                with open(self.legacy_path, 'r') as f:
+                    now = int(time.time())
+                    logged = {listing_id: now for listing_id in json.load(f)}
+                logger.info(f"Migrating {len(logged)} seen listings from {self.legacy_path} to {self.path}")
+            return self._write_compacted(*to_id_arrays(logged))
+
+        seen = self._open_set(SeenIndex(self.index_path), logged)
+        if self.needs_compaction(seen) or seen.index.outdated:
+            seen = self.compact(seen)
+        return seen
+
+    def recover(self):
+        """Move unreadable store files aside and start from an empty store"""
+        for path in (self.path, self.index_path):
+            if os.path.exists(path):
+                os.replace(path, f"{path}.corrupt")
+                logger.warning(f"Moved unreadable {path} to {path}.corrupt")
+        self.records = 0
+        return self._write_compacted(*to_id_arrays({}))
+
+    def append(self, records):
+        """Durably append a batch of (id, last_seen) records with a single fsync"""
+        records = list(records)
+        if not records:
+            return
+        payload = ''.join(f"{listing_id} {last_seen}\n" for listing_id, last_seen in records).encode('ascii')
+        with open(self.path, 'ab') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += len(records)
+
+    def needs_compaction(self, seen=None):
+        """True once the log or the set of evicted-but-still-indexed IDs has grown enough to fold"""
+        pending = self.records + (len(seen.evicted) if seen is not None else 0)
+        return pending > self.compact_min_records
+
+    def compact(self, seen):
+        """Fold the log and evictions into a new index; returns the new SeenIdSet"""
+        ids, last_seen, other = seen.merged_records()
+        seen.index.close()
+        return self._write_compacted(ids, last_seen, other)
+
+    def _open_set(self, index, added):
+        return SeenIdSet(index, added, ttl_seconds=self.ttl_seconds, max_entries=self.max_entries)
+
+    def _write_compacted(self, ids, last_seen, other):
+        index = SeenIndex.build(self.index_path, ids, last_seen)
+        _fsync_dir(self.index_path)
+
+        # IDs the index cannot hold as integers stay in the log
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(''.join(f"{listing_id} {ts}\n" for listing_id, ts in other.items()).encode('ascii'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        self.records = len(other)
+
+        logger.info(f"Compacted seen listings: {len(ids)} indexed, {len(other)} kept in log")
+        return self._open_set(index, other)
+
+    def _read_log(self):
+        """Return {id: newest last_seen} from the log; records without a time count as seen now"""
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            logger.warning(f"Dropping torn record at the end of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+                f.flush()
+                os.fsync(f.fileno())
+            data = data[:complete]
+
+        now = int(time.time())
+        logged = {}
+        lines = data.decode('ascii').split('\n')[:-1]
+        for line in lines:
+            listing_id, _, last_seen = line.partition(' ')
+            if not listing_id:
+                continue
+            last_seen = int(last_seen) if last_seen else now
+            if last_seen > logged.get(listing_id, 0):
+                logged[listing_id] = last_seen
+        self.records = len(lines)
+        return logged
+
+
+def _fsync_dir(path):
+    """Make a rename durable by syncing the containing directory (no-op where unsupported)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+from seen_store import _fsync_dir
+
+logger = logging.getLogger(__name__)
+
+# Listing fields whose changes are reported
+TRACKED_FIELDS = ('name', 'price')
+
+
+def fingerprint(listing):
+    """64-bit hash of a listing's tracked fields"""
+    payload = '\x1f'.join(str(listing.get(field) or '') for field in TRACKED_FIELDS).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(payload, digest_size=8).digest(), 'little')
+
+
+# The first amount in a label. Digit groups are separated by '.', ',' or an apostrophe, or
+# by a space before exactly three digits (so '$120 12 nights' stays 120)
+AMOUNT = re.compile(r"\d+(?:(?:[.,']\d{1,3}|[ \u202f]\d{3})(?!\d))*")
+
+
+def price_value(price):
+    """Turn a price label like '$1,234.50', '€ 1.234' or '€ 99,99' into a comparable number, or None.
+
+    The last '.' or ',' is the decimal separator when one or two digits
+    follow it; otherwise every separator groups thousands.
+    """
+    if not price:
+        return None
+    match = AMOUNT.search(price)
+    if not match:
+        return None
+    amount = match.group(0)
+    whole, separator, fraction = amount, '', ''
+    position = max(amount.rfind('.'), amount.rfind(','))
+    if position >= 0 and len(amount) - position - 1 in (1, 2):
+        whole, separator, fraction = amount[:position], '.', amount[position + 1:]
+    whole = ''.join(ch for ch in whole if ch.isdigit())
+    return round(float(f"{whole}{separator}{fraction}"), 2)
+
+
+class SnapshotStore:
+    """Last known tracked fields of every listing, used to report changes.
+
+    diff() compares each listing on the current page with its snapshot by
+    fingerprint only. The tracked fields are compared one by one only when
+    the fingerprint has changed. The cost per cycle therefore follows the
+    page, not the history.
+
+    Snapshots live in memory. Changed ones are appended to a JSON-lines log
+    in one write and one fsync per cycle. When the log holds more than twice
+    as many lines as there are snapshots, it is rewritten with an atomic
+    rename. prune() drops the snapshots of listings the seen set has
+    forgotten, so both follow the same TTL and size cap.
+    """
+
+    def __init__(self, path='listing_snapshots.log', compact_min_records=1000, relist_after_days=7):
+        self.path = path
+        self.compact_min_records = compact_min_records
+        self.relist_after = int(relist_after_days * 86400)
+        # id -> (fingerprint, *TRACKED_FIELDS)
+        self.snapshots = {}
+        self.records = 0
+
+    def load(self):
+        """Read the log, keeping the last snapshot of each listing and dropping a torn last line"""
+        self.snapshots = {}
+        self.records = 0
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            logger.warning(f"Dropping torn record at the end of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+        for line in data[:complete].splitlines():
+            try:
+                snapshot = json.loads(line)
+            except ValueError:
+                continue
+            fields = tuple(snapshot.get(field) for field in TRACKED_FIELDS)
+            self.snapshots[snapshot['id']] = (fingerprint(snapshot),) + fields
+            self.records += 1
+        return self
+
+    def diff(self, listings, last_seen=None, now=None):
+        """Compare the current page with the snapshots.
+
+        Returns (events, changed). events is a list of dicts with 'kind'
+        ('price_dropped', 'price_increased', 'title_changed' or 'relisted'),
+        'listing', 'old' and 'new'. changed holds the listings whose snapshot
+        must be saved. last_seen(ids) returns the previous last-seen time of
+        each ID, or None; a known listing not seen for `relist_after_days`
+        counts as relisted.
+        """
+        now = int(now if now is not None else time.time())
+        listings = [listing for listing in listings if listing.get('id')]
+        previously_seen = last_seen([listing['id'] for listing in listings]) if last_seen else [None] * len(listings)
+
+        events = []
+        changed = []
+        for listing, seen_at in zip(listings, previously_seen):
+            snapshot = self.snapshots.get(listing['id'])
+            if snapshot is not None and seen_at is not None and now - seen_at >= self.relist_after:
+                events.append({'kind': 'relisted', 'listing': listing, 'old': seen_at, 'new': now})
+
+            # A field missing from this poll (no price shown, say) keeps its stored value
+            fields = tuple(listing.get(field) or (snapshot[index] if snapshot else None)
+                           for index, field in enumerate(TRACKED_FIELDS, 1))
+            current = fingerprint(dict(zip(TRACKED_FIELDS, fields)))
+            if snapshot is not None and snapshot[0] == current:
+                continue
+            changed.append(dict(listing, **dict(zip(TRACKED_FIELDS, fields))))
+            self.snapshots[listing['id']] = (current,) + fields
+            if snapshot is None:
+                continue
+
+            _, old_name, old_price = snapshot
+            if old_name and listing.get('name') and old_name != listing['name']:
+                events.append({'kind': 'title_changed', 'listing': listing, 'old': old_name, 'new': listing['name']})
+            old_value, new_value = price_value(old_price), price_value(listing.get('price'))
+            if old_value is not None and new_value is not None and old_value != new_value:
+                kind = 'price_dropped' if new_value < old_value else 'price_increased'
+                events.append({'kind': kind, 'listing': listing, 'old': old_price, 'new': listing['price']})
+        return events, changed
+
+    def append(self, listings):
+        """Durably save the snapshots of changed listings with a single fsync, compacting when due"""
+        if not listings:
+            return
+        payload = ''.join(json.dumps({field: listing.get(field) for field in ('id',) + TRACKED_FIELDS}) + '\n'
+                          for listing in listings).encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += len(listings)
+        if self.records > max(self.compact_min_records, 2 * len(self.snapshots)):
+            self.compact()
+
+    def prune(self, last_seen):
+        """Drop the snapshots of listings no longer in the seen set, then rewrite the log.
+
+        last_seen(ids) returns the last-seen time of each ID, or None for IDs
+        the seen set has evicted; call it after the seen store compacts.
+        """
+        ids = list(self.snapshots)
+        gone = [listing_id for listing_id, seen_at in zip(ids, last_seen(ids)) if seen_at is None]
+        if not gone:
+            return 0
+        for listing_id in gone:
+            del self.snapshots[listing_id]
+        self.compact()
+        return len(gone)
+
+    def compact(self):
+        """Rewrite the log with one line per listing"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(''.join(json.dumps({'id': listing_id, **dict(zip(TRACKED_FIELDS, fields))}) + '\n'
+                            for listing_id, (_, *fields) in self.snapshots.items()).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        self.records = len(self.snapshots)
+        logger.info(f"Compacted listing snapshots: {self.records} listings")
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TIERS_FILE = 'fetch_tiers.json'
+
+
+def search_key(search):
+    return search.get('id') or search['url']
+
+
+class TieredFetcher:
+    """Fetches each search with the cheapest tier that works for it.
+
+    `tiers` lists (name, fetch) pairs, cheapest first. fetch(searches)
+    returns [(search, listings or None)]. A search starts at the tier that
+    last worked for it and moves to the next tier when a fetch fails or
+    returns fewer listings than its baseline. Each tier keeps its own
+    baseline per search, because tiers can differ in how many result pages
+    they read. The baseline is a moving average of the counts from earlier
+    successful fetches. A fetch must return `baseline_ratio` of it, and
+    `min_listings` unless the search has never returned that many. A tier
+    without a baseline is measured against the best count the search
+    returned on its last poll.
+
+    When a search went up a tier, the cheapest tier that found as many
+    listings as the most expensive one is the one that worked. A search with
+    only two real results therefore settles on HTTP instead of running both
+    tiers on every poll.
+
+    A search that needed a more expensive tier retries the cheap one every
+    `probe_every` polls, and moves back down when that works again. Per-search
+    tier choice, baseline and success counts are kept in fetch_tiers.json
+    across runs. Each tier is only called for the searches that reach it, so
+    a browser tier that is never reached never starts.
+    """
+
+    def __init__(self, tiers, state_path=TIERS_FILE, min_listings=3, baseline_ratio=0.5, probe_every=12,
+                 smoothing=0.2):
+        self.tiers = list(tiers)
+        self.state_path = state_path
+        self.min_listings = min_listings
+        self.baseline_ratio = baseline_ratio
+        self.probe_every = probe_every
+        self.smoothing = smoothing
+        self.state = self._load()
+        self.last_tiers = set()
+
+    def fetch(self, searches):
+        """Return [(search, listings)] for every search, in order"""
+        names = [name for name, _ in self.tiers]
+        start = {}
+        probing = set()
+        for search in searches:
+            stats = self._stats(search)
+            level = names.index(stats['tier']) if stats['tier'] in names else 0
+            if level and stats['polls_since_probe'] >= self.probe_every:
+                logger.info(f"Probing the {names[0]} tier again for '{search['name']}'")
+                probing.add(search_key(search))
+                level = 0
+            start[search_key(search)] = level
+
+        attempts = {}
+        done = set()
+        self.last_tiers = set()
+        for level, (name, fetch) in enumerate(self.tiers):
+            batch = [search for search in searches
+                     if search_key(search) not in done and start[search_key(search)] <= level]
+            if not batch:
+                continue
+            self.last_tiers.add(name)
+            for search, listings in fetch(batch):
+                key = search_key(search)
+                self._tier_stats(search, name)['attempts'] += 1
+                attempts.setdefault(key, []).append((name, listings))
+                if listings is not None and len(listings) >= self.threshold(search, name):
+                    done.add(key)
+                    continue
+                found = 'failed' if listings is None else f"found {len(listings)} listings"
+                logger.info(f"{name} tier {found} for '{search['name']}' (need {self.threshold(search, name)})")
+
+        best = {}
+        for search in searches:
+            key = search_key(search)
+            found = [(name, listings) for name, listings in attempts.get(key, []) if listings is not None]
+            if not found:
+                continue
+            most = max(len(listings) for _, listings in found)
+            # The cheapest tier that found as many listings as any other is the one that worked
+            name, best[key] = next((name, listings) for name, listings in found if len(listings) == most)
+            if most and (key in done or len(found) > 1):
+                self._tier_stats(search, name)['successes'] += 1
+                self._record_success(search, name, most)
+            if most:
+                self._stats(search)['best'] = most
+
+        for search in searches:
+            stats = self._stats(search)
+            if search_key(search) in probing or stats['tier'] == names[0]:
+                stats['polls_since_probe'] = 0
+            else:
+                stats['polls_since_probe'] += 1
+        self._save()
+        return [(search, best.get(search_key(search), [])) for search in searches]
+
+    def threshold(self, search, tier):
+        """Listings a fetch on `tier` must return for the search"""
+        baseline = self._tier_stats(search, tier)['baseline'] or self._stats(search).get('best', 0)
+        if not baseline:
+            return self.min_listings
+        return max(1, min(self.min_listings, int(baseline)), int(baseline * self.baseline_ratio))
+
+    def uses(self, tier):
+        """Whether `tier` ran in the last fetch or is the tier some search has settled on"""
+        return tier in self.last_tiers or any(stats['tier'] == tier for stats in self.state.values())
+
+    def summary(self):
+        lines = []
+        for key, stats in self.state.items():
+            rates = ', '.join(f"{name} {counts['successes']}/{counts['attempts']}"
+                              for name, counts in stats['tiers'].items())
+            baseline = stats['tiers'].get(stats['tier'], {}).get('baseline', 0)
+            lines.append(f"{stats.get('name', key)}: {stats['tier']} tier (baseline {baseline:.0f}; {rates})")
+        return "Fetch tiers: " + ('; '.join(lines) if lines else 'no searches yet')
+
+    def _record_success(self, search, name, count):
+        stats = self._stats(search)
+        if stats['tier'] != name:
+            logger.info(f"Using the {name} tier for '{search['name']}' from now on")
+        stats['tier'] = name
+        counts = self._tier_stats(search, name)
+        if counts['baseline']:
+            counts['baseline'] += self.smoothing * (count - counts['baseline'])
+        else:
+            counts['baseline'] = float(count)
+
+    def _stats(self, search):
+        stats = self.state.setdefault(search_key(search), {
+            'tier': self.tiers[0][0],
+            'polls_since_probe': 0,
+            'tiers': {},
+        })
+        stats['name'] = search['name']
+        return stats
+
+    def _tier_stats(self, search, tier):
+        return self._stats(search)['tiers'].setdefault(tier, {'attempts': 0, 'successes': 0, 'baseline': 0.0})
+
+    def _load(self):
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading fetch tiers from {self.state_path}: {e}")
+        return {}
+
+    def _save(self):
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving fetch tiers: {e}")
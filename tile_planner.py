@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+PLANS_FILE = 'tile_plans.json'
+
+# Airbnb stops paginating a search after this many result pages
+PAGE_CAP = 15
+
+BOX_PARAMS = ('ne_lat', 'ne_lng', 'sw_lat', 'sw_lng')
+
+
+def bounding_box(url):
+    """Return (ne_lat, ne_lng, sw_lat, sw_lng) from a map search URL, or None"""
+    query = dict(parse_qsl(urlsplit(url).query))
+    try:
+        return tuple(float(query[param]) for param in BOX_PARAMS)
+    except (KeyError, ValueError):
+        return None
+
+
+def tile_url(url, box):
+    """The search URL restricted to one map tile"""
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key not in BOX_PARAMS and key != 'search_by_map']
+    query += [(param, f"{value:.7f}") for param, value in zip(BOX_PARAMS, box)]
+    query.append(('search_by_map', 'true'))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def split_box(box):
+    """Split a box into four quadrants"""
+    ne_lat, ne_lng, sw_lat, sw_lng = box
+    mid_lat = (ne_lat + sw_lat) / 2
+    mid_lng = (ne_lng + sw_lng) / 2
+    return [
+        (ne_lat, ne_lng, mid_lat, mid_lng),
+        (ne_lat, mid_lng, mid_lat, sw_lng),
+        (mid_lat, ne_lng, sw_lat, mid_lng),
+        (mid_lat, mid_lng, sw_lat, sw_lng),
+    ]
+
+
+class TilePlanner:
+    """Splits a map search into tiles small enough that no tile hits the page cap.
+
+    Airbnb shows at most PAGE_CAP pages per search, and reports exactly
+    PAGE_CAP when it has truncated the results. A tile whose first page
+    reports more pages than `max_pages`, or PAGE_CAP pages, would lose
+    listings, so it is split into quadrants. Those are fetched in the same
+    cycle, and split again if needed, up to `max_depth` levels and
+    `max_tiles` tiles.
+
+    The leaf tiles and the page count last seen in each are saved per search
+    in tile_plans.json. Later cycles start from that plan instead of probing
+    from the whole box again. rebalance() merges four sibling tiles back
+    into their parent once their pages add up to no more than `max_pages`,
+    so the plan follows density both ways. Each tile counts at least one
+    page, so the sum overestimates the parent, and a merged tile does not
+    split again on the next cycle. With state_path=None the plans are only
+    kept in memory.
+    """
+
+    def __init__(self, state_path=PLANS_FILE, max_pages=PAGE_CAP, max_depth=5, max_tiles=64):
+        self.state_path = state_path
+        self.max_pages = min(max_pages, PAGE_CAP)
+        self.max_depth = max_depth
+        self.max_tiles = max_tiles
+        self.plans = self._load()
+
+    def applies(self, search):
+        """Searches with a map bounding box are sharded unless they set "shard": false"""
+        return search.get('shard', True) is not False and bounding_box(search['url']) is not None
+
+    def tiles(self, search):
+        """The tile boxes to fetch for a search this cycle"""
+        plan = self.plans.get(self._key(search))
+        root = bounding_box(search['url'])
+        if not plan or tuple(plan['root']) != root:
+            plan = {'root': list(root), 'tiles': [{'box': list(root), 'depth': 0, 'pages': None}]}
+            self.plans[self._key(search)] = plan
+        return [tuple(tile['box']) for tile in plan['tiles']]
+
+    def observe(self, search, box, pages):
+        """Record a tile's page count; returns the quadrants to fetch when it must be split"""
+        plan = self.plans[self._key(search)]
+        tile = next(tile for tile in plan['tiles'] if tuple(tile['box']) == tuple(box))
+        tile['pages'] = pages
+        if self._fits(pages) or tile['depth'] >= self.max_depth or len(plan['tiles']) + 3 > self.max_tiles:
+            if not self._fits(pages):
+                logger.warning(f"Tile at depth {tile['depth']} of '{search['name']}' still has {pages} pages")
+            return []
+
+        plan['tiles'].remove(tile)
+        children = split_box(tuple(box))
+        plan['tiles'] += [{'box': list(child), 'depth': tile['depth'] + 1, 'pages': None} for child in children]
+        return children
+
+    def rebalance(self, search):
+        """Merge sibling tiles that have become sparse, then save the plans"""
+        plan = self.plans.get(self._key(search))
+        if plan:
+            merged = True
+            while merged:
+                merged = False
+                by_parent = {}
+                for tile in plan['tiles']:
+                    if tile['depth']:
+                        by_parent.setdefault(self._parent(plan, tile), []).append(tile)
+                for parent, siblings in by_parent.items():
+                    if len(siblings) == 4 and all(tile['pages'] is not None for tile in siblings) \
+                            and self._fits(sum(tile['pages'] for tile in siblings)):
+                        for tile in siblings:
+                            plan['tiles'].remove(tile)
+                        plan['tiles'].append({'box': list(parent), 'depth': siblings[0]['depth'] - 1,
+                                              'pages': sum(tile['pages'] for tile in siblings)})
+                        merged = True
+            logger.info(f"Tile plan for '{search['name']}': {len(plan['tiles'])} tiles")
+        self.save()
+
+    def _fits(self, pages):
+        """Whether a tile with this many pages is read in full; PAGE_CAP pages means truncated results"""
+        return pages <= self.max_pages and pages < PAGE_CAP
+
+    def _parent(self, plan, tile):
+        """The box of the tile's parent, found by walking down from the root"""
+        box = tuple(plan['root'])
+        target = tuple(tile['box'])
+        for _ in range(tile['depth'] - 1):
+            box = next(child for child in split_box(box) if _contains(child, target))
+        return box
+
+    def _key(self, search):
+        return search.get('id') or search['url']
+
+    def _load(self):
+        try:
+            if self.state_path and os.path.exists(self.state_path):
+                with open(self.state_path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading tile plans from {self.state_path}: {e}")
+        return {}
+
+    def save(self):
+        """Write the plans to state_path; rebalance() already does this after each search"""
+        if not self.state_path:
+            return
+        try:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.plans, f)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Error saving tile plans: {e}")
+
+
+def _contains(outer, inner):
+    ne_lat, ne_lng, sw_lat, sw_lng = outer
+    inner_ne_lat, inner_ne_lng, inner_sw_lat, inner_sw_lng = inner
+    eps = 1e-9
+    return (inner_ne_lat <= ne_lat + eps and inner_sw_lat >= sw_lat - eps
+            and inner_ne_lng <= ne_lng + eps and inner_sw_lng >= sw_lng - eps)
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from snapshot_store import SnapshotStore, fingerprint
+from tiered_fetch import search_key
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    search TEXT NOT NULL,
+    schedule TEXT NOT NULL,
+    due REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    token INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (due);
+CREATE TABLE IF NOT EXISTS listings (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    price TEXT,
+    last_seen INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS listings_last_seen ON listings (last_seen);
+CREATE TABLE IF NOT EXISTS nodes (
+    node TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS node_searches (
+    node TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (node, key)
+);
+"""
+
+# Stay under SQLite's default limit on bound parameters
+CHUNK = 500
+
+
+def node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """Search jobs and seen state shared by several monitor nodes through one SQLite file.
+
+    Every node calls sync() with its searches. The union of all nodes'
+    searches becomes the job list, so a new node adds capacity without any
+    other configuration. Each node's searches are registered under its name,
+    and lease() doubles as its heartbeat. Once no node that heartbeated in
+    the last `node_timeout` seconds lists a search, its job is deleted, so a
+    search removed from the config stops being polled. lease() hands a node
+    the due jobs that nobody holds, for `lease_seconds`. A job whose node
+    crashed becomes free again when the lease runs out.
+
+    Each lease carries a token, which is bumped whenever the job is leased.
+    commit() runs in one write transaction. It first checks the token, so a
+    node whose lease was taken over cannot commit stale results. It then
+    diffs the listings against the shared seen state, stores them, and
+    reschedules the job. Each new listing and each change is returned to
+    exactly one commit, and only that node emails about it. A node that
+    crashes after committing loses those emails but never repeats them.
+    seed() adds what a node already knew before joining, so the first
+    distributed run does not report it again. evict() applies the same TTL
+    and size cap as the local seen store.
+
+    The file may live on shared storage. The default rollback journal is
+    used because WAL does not work over network file systems.
+    """
+
+    def __init__(self, path, lease_seconds=600, relist_after_days=7, node_timeout=None, ttl_days=None,
+                 max_entries=None, evict_every=3600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.relist_after_days = relist_after_days
+        self.node_timeout = node_timeout or 2 * lease_seconds
+        self.ttl_seconds = int(ttl_days * 86400) if ttl_days else None
+        self.max_entries = max_entries or None
+        self.evict_every = evict_every
+        self.owner = node_id()
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.executescript(SCHEMA)
+        self.leased = 0
+        self.committed = 0
+        self.lost = 0
+        self.evicted = 0
+        self._evicted_at = 0.0
+        self._searches = None
+
+    def sync(self, searches, new_entry, now=None):
+        """Register this node's searches as jobs; new_entry(search) gives a new job's schedule"""
+        now = now if now is not None else time.time()
+        self._searches = (list(searches), new_entry)
+        with self._transaction():
+            self._register()
+            self._heartbeat(now)
+
+    def seed(self, listings):
+        """Add (id, name, price, last_seen) tuples this node knew before joining; known rows keep their data"""
+        listings = list(listings)
+        with self._transaction():
+            for start in range(0, len(listings), CHUNK):
+                self.db.executemany("INSERT INTO listings (id, name, price, last_seen) VALUES (?, ?, ?, ?) "
+                                    "ON CONFLICT (id) DO UPDATE SET name = COALESCE(listings.name, excluded.name), "
+                                    "price = COALESCE(listings.price, excluded.price), "
+                                    "last_seen = MAX(listings.last_seen, excluded.last_seen)",
+                                    listings[start:start + CHUNK])
+        logger.info(f"Seeded the work queue with {len(listings)} known listings")
+
+    def evict(self, now=None):
+        """Forget listings past the TTL, then the least recently seen beyond the size cap; returns the count
+
+        Runs at most every `evict_every` seconds.
+        """
+        now = now if now is not None else time.time()
+        if (not self.ttl_seconds and not self.max_entries) or now - self._evicted_at < self.evict_every:
+            return 0
+        self._evicted_at = now
+        dropped = 0
+        with self._transaction():
+            if self.ttl_seconds:
+                dropped += self.db.execute("DELETE FROM listings WHERE last_seen < ?",
+                                           (int(now) - self.ttl_seconds,)).rowcount
+            if self.max_entries:
+                dropped += self.db.execute("DELETE FROM listings WHERE id IN (SELECT id FROM listings "
+                                           "ORDER BY last_seen DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+        self.evicted += dropped
+        return dropped
+
+    def lease(self, limit, now=None):
+        """Lease up to `limit` due jobs; returns [{'key', 'search', 'schedule', 'token'}]"""
+        now = now if now is not None else time.time()
+        with self._transaction():
+            self._heartbeat(now)
+            rows = self.db.execute("SELECT key, search, schedule, token FROM jobs "
+                                   "WHERE due <= ? AND lease_until < ? ORDER BY due LIMIT ?",
+                                   (now, now, limit)).fetchall()
+            for key, _, _, _ in rows:
+                self.db.execute("UPDATE jobs SET owner = ?, lease_until = ?, token = token + 1 WHERE key = ?",
+                                (self.owner, now + self.lease_seconds, key))
+        self.leased += len(rows)
+        return [{'key': key, 'search': json.loads(search), 'schedule': json.loads(schedule), 'token': token + 1}
+                for key, search, schedule, token in rows]
+
+    def commit(self, lease, listings, reschedule, now=None):
+        """Commit a fetched job. Returns (new listings, change events), or None if the lease was lost.
+
+        reschedule(schedule, activity) updates the job's schedule in place,
+        where activity is the number of new and changed listings.
+        """
+        now = int(now if now is not None else time.time())
+        with self._transaction():
+            if not self._holds(lease):
+                self.lost += 1
+                return None
+            listings = [listing for listing in listings if listing.get('id')]
+            known = {}
+            ids = [listing['id'] for listing in listings]
+            for start in range(0, len(ids), CHUNK):
+                chunk = ids[start:start + CHUNK]
+                known.update((row[0], row[1:]) for row in self.db.execute(
+                    f"SELECT id, name, price, last_seen FROM listings WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk))
+
+            snapshots = SnapshotStore(relist_after_days=self.relist_after_days)
+            snapshots.snapshots = {listing_id: (fingerprint({'name': name, 'price': price}), name, price)
+                                   for listing_id, (name, price, _) in known.items()}
+            events, _ = snapshots.diff(listings, lambda ids: [known[i][2] if i in known else None for i in ids], now)
+            new_listings = [listing for listing in listings if listing['id'] not in known]
+
+            self.db.executemany("INSERT INTO listings (id, name, price, last_seen) VALUES (?, ?, ?, ?) "
+                                "ON CONFLICT (id) DO UPDATE SET name = excluded.name, price = excluded.price, "
+                                "last_seen = excluded.last_seen",
+                                [(listing['id'], listing.get('name'), listing.get('price'), now)
+                                 for listing in listings])
+            self._release(lease, reschedule, len(new_listings) + len(events))
+        self.committed += 1
+        return new_listings, events
+
+    def release(self, lease, reschedule):
+        """Give a job back without results (after a failed fetch); returns False if the lease was lost"""
+        with self._transaction():
+            if not self._holds(lease):
+                self.lost += 1
+                return False
+            self._release(lease, reschedule, 0)
+        return True
+
+    def wait_time(self, now=None):
+        """Seconds until the next job is due or a lease runs out"""
+        now = now if now is not None else time.time()
+        row = self.db.execute("SELECT MIN(MAX(due, lease_until)) FROM jobs").fetchone()
+        return max(0.0, row[0] - now) if row and row[0] is not None else self.lease_seconds
+
+    def summary(self):
+        jobs, leased = self.db.execute("SELECT COUNT(*), COALESCE(SUM(lease_until >= ?), 0) FROM jobs",
+                                       (time.time(),)).fetchone()
+        return (f"Work queue: {jobs} jobs, {leased} leased; this node leased {self.leased}, "
+                f"committed {self.committed}, lost {self.lost} leases, evicted {self.evicted} listings")
+
+    def close(self):
+        self.db.close()
+
+    def _register(self):
+        searches, new_entry = self._searches
+        for search in searches:
+            entry = new_entry(search)
+            self.db.execute("INSERT INTO jobs (key, search, schedule, due) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT (key) DO UPDATE SET search = excluded.search",
+                            (search_key(search), json.dumps(search), json.dumps(entry), entry['next_due']))
+        self.db.execute("DELETE FROM node_searches WHERE node = ?", (self.owner,))
+        self.db.executemany("INSERT OR IGNORE INTO node_searches (node, key) VALUES (?, ?)",
+                            [(self.owner, search_key(search)) for search in searches])
+
+    def _heartbeat(self, now):
+        """Mark this node alive, and delete the jobs of searches that no live node lists any more"""
+        self.db.execute("INSERT INTO nodes (node, heartbeat) VALUES (?, ?) "
+                        "ON CONFLICT (node) DO UPDATE SET heartbeat = excluded.heartbeat", (self.owner, now))
+        # A node that stalled for longer than node_timeout was taken for dead; register its searches again
+        if self._searches and self.db.execute("SELECT 1 FROM node_searches WHERE node = ? LIMIT 1",
+                                              (self.owner,)).fetchone() is None:
+            self._register()
+        dead = now - self.node_timeout
+        self.db.execute("DELETE FROM node_searches WHERE node IN (SELECT node FROM nodes WHERE heartbeat < ?)",
+                        (dead,))
+        self.db.execute("DELETE FROM nodes WHERE heartbeat < ?", (dead,))
+        removed = self.db.execute("DELETE FROM jobs WHERE key NOT IN (SELECT key FROM node_searches)").rowcount
+        if removed:
+            logger.info(f"Removed {removed} job(s) that no node is configured for")
+
+    def _holds(self, lease):
+        row = self.db.execute("SELECT owner, token FROM jobs WHERE key = ?", (lease['key'],)).fetchone()
+        return row is not None and row[0] == self.owner and row[1] == lease['token']
+
+    def _release(self, lease, reschedule, activity):
+        schedule = lease['schedule']
+        reschedule(schedule, activity)
+        self.db.execute("UPDATE jobs SET schedule = ?, due = ?, owner = NULL, lease_until = 0 WHERE key = ?",
+                        (json.dumps(schedule), schedule['next_due'], lease['key']))
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE takes the write lock up front, so nodes never deadlock upgrading a read lock"""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
@@ -0,0 +1,140 @@
+import logging
+import multiprocessing
+import multiprocessing.util
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from http_session import traffic_summary
+from listing_parser import parse_search_page
+from metrics import METRICS
+from search_fetcher import SearchFetcher
+from tile_planner import TilePlanner
+
+logger = logging.getLogger(__name__)
+
+# Fields of the listing records workers send back, in tuple order
+RECORD_FIELDS = ('id', 'name', 'title', 'url', 'price', 'rating', 'review_count', 'latitude', 'longitude', 'image_url')
+
+# Per-process fetch settings and the process's SearchFetcher, set by _init_worker
+_worker = {}
+
+
+def _init_worker(headers, parse, limiter, options):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    fetcher = SearchFetcher(headers, parse=parse, limiter=limiter, **options)
+    # Pool workers leave through os._exit, which skips atexit but runs multiprocessing finalizers
+    multiprocessing.util.Finalize(fetcher, fetcher.close, exitpriority=10)
+    _worker.update(max_pages=options['max_pages'], fetcher=fetcher)
+
+
+def _fetch_shard(searches, cursors, plans):
+    """Fetch and parse one shard of searches in a worker process.
+
+    Returns ([(listing records or None, error)], cursors, plans, metrics,
+    traffic), where a listing record is a tuple of RECORD_FIELDS, metrics is
+    what the shard recorded in this process's METRICS, and traffic is what
+    it added to the fetcher's stats.
+    """
+    planner = None
+    if plans is not None:
+        planner = TilePlanner(state_path=None, max_pages=_worker['max_pages'])
+        planner.plans = plans
+    errors = {}
+    fetcher = _worker['fetcher']
+    before = dict(fetcher.stats)
+    results = fetcher.fetch(searches, cursor_cache=cursors, planner=planner, errors=errors)
+    records = []
+    for search, listings in results:
+        key = search.get('id') or search['url']
+        if listings is not None:
+            listings = [tuple(listing.get(field) for field in RECORD_FIELDS) for listing in listings]
+        records.append((listings, errors.get(key)))
+    traffic = {name: value - before[name] for name, value in fetcher.stats.items()}
+    return records, cursors, planner.plans if planner else None, METRICS.take(), traffic
+
+
+class SearchWorkerPool:
+    """Fetches and parses searches in worker processes, so parsing uses every core.
+
+    fetch() deals the searches round-robin into one shard per worker. Each
+    worker fetches its shard on its own event loop and connection pool,
+    parses the pages, and returns compact listing records. The diff against
+    the seen set and the notifications stay in the parent.
+
+    Each worker keeps its own SearchFetcher, so its connections stay open
+    between calls; otherwise workers are stateless. The page cursors and
+    tile plans of a shard's searches are sent with the shard and merged back
+    into the parent's cursor cache and TilePlanner, which remains the only
+    writer of tile_plans.json. The counters and stage timings a shard
+    records are merged into the parent's METRICS the same way, and their
+    traffic into the pool's stats. Every worker draws from the same RateLimiter file.
+    "newest_first" searches read all their pages here, because the seen set
+    stays in the parent.
+    """
+
+    def __init__(self, workers, headers, parse=parse_search_page, limiter=None, max_concurrency=8, per_host_limit=4,
+                 max_pages=1, fan_out=4):
+        self.workers = workers
+        options = {
+            'max_concurrency': max_concurrency,
+            'per_host_limit': per_host_limit,
+            'max_pages': max_pages,
+            'fan_out': fan_out,
+        }
+        # spawn, not fork: the parent runs background threads (the email sender)
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(headers, parse, limiter, options))
+        self.stats = {'requests': 0, 'handshakes': 0, 'not_modified': 0, 'bytes_on_wire': 0, 'bytes_decoded': 0}
+
+    def fetch(self, searches, cursor_cache=None, planner=None, errors=None):
+        """Return [(search, listings or None)] in order, like SearchFetcher.fetch"""
+        started = time.monotonic()
+        shards = [list(range(index, len(searches), self.workers)) for index in range(min(self.workers, len(searches)))]
+        futures = []
+        sent = []
+        for shard in shards:
+            keys = [searches[index].get('id') or searches[index]['url'] for index in shard]
+            cursors = {key: value for key, value in (cursor_cache or {}).items()
+                       if key.split('@')[0] in keys}
+            plans = {key: planner.plans[key] for key in keys if key in planner.plans} if planner else None
+            futures.append(self.executor.submit(_fetch_shard, [searches[index] for index in shard], cursors, plans))
+            sent.append(set(cursors))
+
+        results = [None] * len(searches)
+        for shard, future, sent_keys in zip(shards, futures, sent):
+            try:
+                records, cursors, plans, recorded, traffic = future.result()
+            except Exception as e:
+                logger.error(f"Fetch worker failed: {e}")
+                records, cursors, plans = [(None, 'failed')] * len(shard), None, {}
+                METRICS.count('fetch_errors', len(shard), reason='worker')
+            else:
+                METRICS.merge(recorded)
+                for name, value in traffic.items():
+                    self.stats[name] += value
+            if cursor_cache is not None and cursors is not None:
+                # The worker dropped the cursors of tiles that were split or merged away
+                for key in sent_keys - set(cursors):
+                    cursor_cache.pop(key, None)
+                cursor_cache.update(cursors)
+            if planner is not None:
+                planner.plans.update(plans)
+            for index, (listings, error) in zip(shard, records):
+                search = searches[index]
+                if error is not None and errors is not None:
+                    errors[search.get('id') or search['url']] = error
+                if listings is not None:
+                    listings = [dict(zip(RECORD_FIELDS, record)) for record in listings]
+                results[index] = (search, listings)
+
+        if planner is not None:
+            planner.save()
+        logger.info(f"Fetched {len(searches)} searches in {len(shards)} worker(s) in {time.monotonic() - started:.2f}s")
+        return results
+
+    def summary(self):
+        """One-line description of the workers' traffic so far"""
+        return traffic_summary(self.stats)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)